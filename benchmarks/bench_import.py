@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+import_vocab_csv() cost on a synthetic deck, for a CSV mixing new words, new translations of
+existing words and translations the deck already has, then for the same file imported again,
+where every row is a duplicate. Checks the import summary counts each kind of row.
+
+usage: benchmarks/bench_import.py [size] [rows]
+"""
+import sys
+import time
+from bench_utils import setup_env, make_deck, new_builder, print_table
+
+setup_env()
+
+# Thirds of new words, new translations of existing words and translations already in the deck
+def make_csv(rows):
+    lines = []
+    for i in range(rows):
+        if i % 3 == 0: lines.append(f"new{i},Noun,newtrans{i}")
+        elif i % 3 == 1: lines.append(f"word{i},Noun,extra{i}")
+        else: lines.append(f"word{i},Noun,trans{i}_0")
+    return "\n".join(lines).encode('utf-8')
+
+def import_ms(app, data):
+    start = time.perf_counter()
+    summary = app.import_vocab_csv(file=data)
+    return (time.perf_counter() - start) * 1000, summary
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    app = new_builder(make_deck(size))
+    data = make_csv(rows)
+    first, summary = import_ms(app, data)
+    duplicates = rows // 3
+    assert summary["rows"] == rows and summary["duplicates"] == duplicates, summary
+    assert summary["imported"] == rows - duplicates, summary
+    again, summary = import_ms(app, data)
+    assert summary["duplicates"] == rows and summary["imported"] == 0, summary
+    print_table(["deck", "rows", "import ms", "re-import ms"], [[size, rows, f"{first:.0f}", f"{again:.0f}"]])
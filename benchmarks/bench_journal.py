@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Write amplification of mark_correct: bytes written to disk per answer with whole-file snapshots
+(VB_PERSISTENCE=snapshot) versus the append-only journal (VB_PERSISTENCE=journal). Backup copies
+and journal compactions are included in the totals.
+
+usage: benchmarks/bench_journal.py [sizes...]
+"""
+import os
+import sys
+import time
+from bench_utils import setup_env, make_deck, new_builder, vocab_filename, print_table
+
+setup_env()
+import vocab_store
+
+ANSWERS = 200
+
+def run(size, persistence):
+    vocab_store.PERSISTENCE = persistence
+    to_lang = f"{persistence[:2]}{size}"
+    deck = make_deck(size)
+    app = new_builder(deck, to_lang=to_lang)
+    app.select_words()
+    filename = vocab_filename(to_lang)
+    backup_bytes = [0]
+    backup = app.backup_vocab_file
+    def counting_backup():
+        backup()
+        backup_bytes[0] += os.path.getsize(filename)
+    app.backup_vocab_file = counting_backup
+    start_bytes = app.store.bytes_written
+    start = time.perf_counter()
+    for i in range(ANSWERS):
+        app.mark_correct(deck[f"word{(i * 7919) % size}"]["translations"][0])
+    elapsed = time.perf_counter() - start
+    written = app.store.bytes_written - start_bytes + backup_bytes[0]
+    return [size, persistence, f"{written / ANSWERS:.0f}", f"{written / ANSWERS / os.path.getsize(filename):.4f}",
+            f"{elapsed * 1000 / ANSWERS:.3f}"]
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1:]] or [1000, 10000, 100000]
+    rows = []
+    for size in sizes:
+        for persistence in ("snapshot", "journal"):
+            rows.append(run(size, persistence))
+    print_table(["entries", "mode", "bytes/answer", "file sizes/answer", "ms/answer"], rows)
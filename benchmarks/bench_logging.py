@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Request throughput with logging off, with the previous synchronous handlers at DEBUG, and with
+the queue handler at DEBUG and at the default INFO level. Each mode runs in its own process, so
+logging is configured from scratch, and sends a mix of next_word, mark_correct and paged get_all
+requests through the Flask app. Console output goes to /dev/null; the log file is real.
+
+usage: benchmarks/bench_logging.py [requests] [deck size]
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+from bench_utils import print_table
+
+MODES = [
+    ("off", {"VB_LOG_LEVEL": "CRITICAL"}),
+    ("sync, DEBUG", {"VB_LOG_QUEUE": "off", "VB_LOG_LEVEL": "DEBUG"}),
+    ("queue, DEBUG", {"VB_LOG_LEVEL": "DEBUG"}),
+    ("queue, INFO", {"VB_LOG_LEVEL": "INFO"}),
+]
+
+LANGS = {"xx": {"name": "Lang X", "nativeName": "Lang X"}, "yy": {"name": "Lang Y", "nativeName": "Lang Y"}}
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+# One mode's run, in a child process. Prints its results as JSON.
+def run(count, size):
+    from bench_utils import setup_env, make_deck, write_deck, vocab_filename
+    setup_env()
+    os.makedirs(os.environ["VB_DATA_DIR"], exist_ok=True)
+    write_deck(vocab_filename(), make_deck(size))
+    import server
+    import log_config
+    server.shared.client.get_languages = lambda: LANGS
+    client = server.api.test_client()
+    client.get("/init?from_lang=yy&to_lang=xx&min_correct=5&min_age=0&part_of_speech=Any")
+    client.get("/vocab/select_words")
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        t = time.perf_counter()
+        word = client.get("/vocab/next_word").get_json()
+        if not word:
+            client.get("/vocab/select_words")
+        elif i % 3 == 0:
+            client.post("/vocab/mark_correct", json={"text": word["text"]})
+        elif i % 3 == 1:
+            client.get("/vocab/get_all?limit=20")
+        samples.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - start
+    # Include writing out what is still queued
+    flush_start = time.perf_counter()
+    log_config.stop()
+    flush = time.perf_counter() - flush_start
+    samples.sort()
+    log_file = os.path.join(os.environ["VB_LOGGING_DIR"], "vb.log")
+    print(json.dumps({"req_s": count / elapsed, "p50": percentile(samples, 0.5), "p99": percentile(samples, 0.99),
+                      "flush_ms": flush * 1000, "log_bytes": os.path.getsize(log_file) if os.path.exists(log_file) else 0}))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        run(int(sys.argv[2]), int(sys.argv[3]))
+        sys.exit(0)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rows = []
+    for name, env in MODES:
+        result = subprocess.run([sys.executable, __file__, "--run", str(count), str(size)],
+                                env={**os.environ, **env}, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        r = json.loads(result.stdout.strip().splitlines()[-1])
+        rows.append([name, f"{r['req_s']:.0f}", f"{r['p50']:.3f}", f"{r['p99']:.3f}", f"{r['flush_ms']:.1f}", r["log_bytes"]])
+    print(f"{count} requests, deck of {size} entries")
+    print_table(["logging", "req/s", "p50 ms", "p99 ms", "flush ms", "log bytes"], rows)
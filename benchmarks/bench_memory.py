@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Memory per vocab entry held by VocabStore, for generated decks. Each size is loaded in a fresh
+process and measured with tracemalloc: the store as loaded, with its translation and due indexes,
+and the entries alone, with the indexes dropped. A second, untraced process times loading the
+file, select_due over the whole deck and writing the vocab file.
+
+usage: benchmarks/bench_memory.py [size ...]
+"""
+import os
+import sys
+import gc
+import json
+import time
+import subprocess
+from bench_utils import setup_env, write_deck, print_table
+from deck_generator import generate_deck
+
+INDEXES = ("by_translation", "by_normalized", "by_list", "indexed", "due", "due_days", "due_of")
+
+def measure(filename, size):
+    import tracemalloc
+    from vocab_store import VocabStore
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    store = VocabStore(filename)
+    store.load()
+    gc.collect()
+    total = tracemalloc.get_traced_memory()[0] - base
+    for name in INDEXES:
+        setattr(store, name, {})
+    gc.collect()
+    entries = tracemalloc.get_traced_memory()[0] - base
+    return {"store": total / size, "entries": entries / size}
+
+def timings(filename, size):
+    from vocab_store import VocabStore
+    start = time.perf_counter()
+    store = VocabStore(filename)
+    store.load()
+    load = time.perf_counter() - start
+    start = time.perf_counter()
+    store.select_due(0)
+    select = time.perf_counter() - start
+    start = time.perf_counter()
+    store.write_snapshot()
+    save = time.perf_counter() - start
+    return {"load_ms": load * 1000, "select_ms": select * 1000, "save_ms": save * 1000}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("--measure", "--time"):
+        setup_env()
+        run = measure if sys.argv[1] == "--measure" else timings
+        print(json.dumps(run(sys.argv[2], int(sys.argv[3]))))
+        sys.exit(0)
+    sizes = [int(s) for s in sys.argv[1:]] or [100000, 1000000]
+    scratch = setup_env()
+    rows = []
+    for size in sizes:
+        filename = os.path.join(scratch, f"deck_{size}.json")
+        write_deck(filename, generate_deck(size))
+        result = {}
+        for mode in ("--measure", "--time"):
+            out = subprocess.run([sys.executable, __file__, mode, filename, str(size)], stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL, text=True, check=True).stdout
+            result.update(json.loads(out.strip().splitlines()[-1]))
+        rows.append([size, f"{result['entries']:.0f}", f"{result['store']:.0f}", f"{result['load_ms']:.0f}",
+                     f"{result['select_ms']:.1f}", f"{result['save_ms']:.0f}"])
+        os.remove(filename)
+    print_table(["entries", "bytes/entry", "with indexes", "load ms", "select_due ms", "save ms"], rows)
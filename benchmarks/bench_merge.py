@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+merge_vocab() cost for k incoming words against decks of growing size: the previous implementation,
+which scanned each entry's translations and rebuilt the whole vocabulary per word on update, versus
+the store's translation indexes. Indexed merges should cost the same whatever the deck size.
+Persistence is excluded from both timings.
+
+usage: benchmarks/bench_merge.py [words] [size ...]
+"""
+import sys
+import copy
+import time
+from bench_utils import setup_env, make_deck, new_builder, print_table
+
+setup_env()
+
+# Previous merge_vocab(), minus set_vocab()
+def legacy_merge(vocab, new_words, update=False):
+    for w_from, w_to, part_of_speech in new_words:
+        if isinstance(w_from, str):
+            w_from_l = w_from.split(',')
+        else:
+            w_from_l = w_from
+        if w_to in vocab:
+            trans = vocab[w_to]["translations"]
+            found = False
+            for w in w_from_l:
+              if w.strip().lower() in map(lambda x: x.strip().lower(), trans):
+                found = True
+                break
+            if not found:
+              trans.append(w_from)
+            vocab[w_to]['part'] = part_of_speech
+        else:
+            if update:
+               vocab = dict(filter(lambda x: x[1]['translations'] != w_from_l, vocab.items()))
+            vocab[w_to] = {"translations": w_from_l, "lastCorrect": "", "count": 0, "part": part_of_speech}
+    return vocab
+
+# Half the words extend existing entries, half replace an entry's translations under a new key
+def incoming(deck, k):
+    keys = list(deck)
+    words = []
+    for i in range(k):
+        key = keys[(i * 7919) % len(keys)]
+        if i % 2:
+            words.append((f"new{i}", key, "Noun"))
+        else:
+            words.append((",".join(deck[key]["translations"]), f"moved{i}", "Noun"))
+    return words
+
+def elapsed_ms(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+if __name__ == "__main__":
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sizes = [int(a) for a in sys.argv[2:]] or [10000, 50000, 200000]
+    rows = []
+    for size in sizes:
+        deck = make_deck(size)
+        words = incoming(deck, k)
+        for update in (False, True):
+            vocab = copy.deepcopy(deck)
+            result = []
+            legacy = elapsed_ms(lambda: result.append(legacy_merge(vocab, words, update)))
+            app = new_builder(deck)
+            app.set_vocab = lambda vocab=None: None
+            indexed = elapsed_ms(lambda: app.merge_vocab(words, update=update))
+            assert dict(app.store.items()) == result[0]
+            rows.append([size, k, "update" if update else "add", f"{legacy:.1f}", f"{indexed:.2f}"])
+    print_table(["entries", "words", "mode", "list scan ms", "indexed ms"], rows)
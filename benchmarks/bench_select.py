@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+select_words() cost on a large synthetic deck: the previous full scan, which parses every entry's
+lastCorrect date, versus VocabStore's due index. Indexed selection should track the number of due
+words rather than the deck size.
+
+usage: benchmarks/bench_select.py [size]
+"""
+import sys
+from datetime import date
+from bench_utils import setup_env, make_deck, new_builder, time_ms, print_table
+
+setup_env()
+
+# Previous select_words() filter
+def legacy_select(vocab, min_age, part_of_speech):
+    selected = []
+    for k, v in vocab.items():
+        if k.strip() == '': continue
+        if len(v["lastCorrect"]) and (date.today() - date.fromisoformat(v['lastCorrect'])).days < int(min_age):
+            continue
+        if part_of_speech != 'Any' and v['part'] != part_of_speech:
+            continue
+        selected.append((k, v["translations"]))
+    return selected
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    deck = make_deck(size, never_ratio=0.01, max_days=365)
+    app = new_builder(deck)
+    store = app.store
+    rows = []
+    for min_age in (0, 180, 330, 360, 400):
+        for part in ('Any', 'Noun'):
+            selected = store.select_due(min_age, part)
+            # select_due() gives translations as tuples, the full scan as lists
+            assert sorted((k, list(t)) for k, t in selected) == \
+              sorted((k, list(t)) for k, t in legacy_select(deck, min_age, part))
+            rows.append([size, min_age, part, len(selected),
+                         f"{time_ms(lambda: legacy_select(deck, min_age, part), repeat=3):.1f}",
+                         f"{time_ms(lambda: store.select_due(min_age, part), repeat=3):.2f}"])
+    print_table(["entries", "min_age", "part", "due", "full scan ms", "due index ms"], rows)
+    key = next(iter(deck))
+    print(f"mark_correct index update: {time_ms(lambda: store.mark_correct(key, date.today().isoformat()), repeat=101) * 1000:.1f} us")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Cold start times, each in a fresh process: importing vocab_builder and server, then starting the
+server and polling until /alive answers, until startup setup has finished (/languages/get returns
+the catalog) and until a first /init succeeds. Server starts run on a first-run data dir, which
+gets the initial data files copied in, and on a data dir already set up. A language catalog is
+written to the data dir beforehand, and the translator endpoint points at a closed port, so no
+run touches the network.
+
+usage: benchmarks/bench_startup.py [repeat]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import tempfile
+import subprocess
+import urllib.request
+from bench_utils import ROOT_DIR, print_table
+
+SERVER_DIR = os.path.join(ROOT_DIR, 'vocab_builder')
+LANGS = {"xx": {"name": "Lang X", "nativeName": "Lang X"}, "yy": {"name": "Lang Y", "nativeName": "Lang Y"}}
+# Seconds between polls. Shorter intervals take CPU from the server starting up on small machines.
+POLL_INTERVAL = 0.01
+INIT = "/init?from_lang=yy&to_lang=xx&min_correct=5&min_age=0&part_of_speech=Any"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+def scratch_env(first_run):
+    scratch = tempfile.mkdtemp(prefix="vb_bench_")
+    data_dir = os.path.join(scratch, "data")
+    os.makedirs(data_dir)
+    with open(os.path.join(data_dir, "languages.json"), 'w') as f:
+        json.dump({"fetched": time.time(), "languages": LANGS}, f)
+    if not first_run:
+        for name in os.listdir(os.path.join(ROOT_DIR, 'initial-data')):
+            shutil.copy(os.path.join(ROOT_DIR, 'initial-data', name), data_dir)
+    env = {**os.environ, "VB_DATA_DIR": data_dir, "VB_LOGGING_DIR": os.path.join(scratch, "logs"),
+           "VB_TRANSLATOR_ENDPOINT": f"http://127.0.0.1:{free_port()}", "VB_TRANSLATOR_RETRIES": "0"}
+    return scratch, env
+
+# Milliseconds to import module in a new interpreter, not counting interpreter startup
+def import_ms(module):
+    scratch, env = scratch_env(False)
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    try:
+        out = subprocess.run([sys.executable, "-c", code], cwd=SERVER_DIR, env=env, stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, text=True, check=True).stdout
+        return float(out.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def get(port, path):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as resp:
+            return resp.status, resp.read()
+    except OSError:
+        return None, b""
+
+# Milliseconds from launching the server to /alive answering, to the catalog being served and to
+# a first /init succeeding
+def server_ms(first_run):
+    scratch, env = scratch_env(first_run)
+    port = free_port()
+    env["VITE_SERVER_PORT"] = str(port)
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "server.py"], cwd=SERVER_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    times = []
+    try:
+        for path, ok in (("/alive", lambda b: True), ("/languages/get", lambda b: b"xx" in b),
+                         (INIT, lambda b: b"Initialized" in b)):
+            while True:
+                status, body = get(port, path)
+                if status == 200 and ok(body): break
+                if proc.poll() is not None or time.perf_counter() - start > 30:
+                    raise RuntimeError(f"Server didn't answer {path}")
+                time.sleep(POLL_INTERVAL)
+            times.append((time.perf_counter() - start) * 1000)
+        return times
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def median(samples):
+    return sorted(samples)[len(samples) // 2]
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rows = []
+    for module in ("vocab_builder", "server"):
+        rows.append([f"import {module}", f"{median([import_ms(module) for _ in range(repeat)]):.1f}", "", ""])
+    for first_run in (True, False):
+        runs = [server_ms(first_run) for _ in range(repeat)]
+        rows.append([f"server, {'first run' if first_run else 'data dir set up'}",
+                     *(f"{median([r[i] for r in runs]):.1f}" for i in range(3))])
+    print(f"Median of {repeat} runs, in ms")
+    print_table(["", "imported / alive", "catalog served", "first /init"], rows)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Translator lookups per second against a local stub of the /translate endpoint: a new connection
+per call through module-level requests.post (the previous client) versus MSTranslatorClient's
+pooled keep-alive session at several concurrency levels. The stub speaks plain HTTP, so the
+TLS handshakes that pooling saves against the real service are not part of the comparison.
+
+usage: benchmarks/bench_translator.py [lookups] [stub latency ms]
+"""
+import sys
+import json
+import time
+import threading
+import requests
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from bench_utils import setup_env, print_table
+
+setup_env()
+from ms_translater_client import MSTranslatorClient
+
+LATENCY = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(LATENCY)
+        data = json.dumps([{"translations": [{"text": item["text"].upper()}]} for item in body]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def lookups_per_second(fn, words):
+    start = time.perf_counter()
+    fn(words)
+    return len(words) / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    url = start_stub()
+    words = [f"word{i}" for i in range(lookups)]
+
+    def unpooled(words):
+        for w in words:
+            requests.post(url + '/translate?api-version=3.0', params={"from": "it", "to": "en"},
+                          json=[{"text": w}], headers={"Connection": "close"}, timeout=5.0).json()
+
+    rows = [["new connection per call", 1, f"{lookups_per_second(unpooled, words):.0f}"]]
+    for concurrency in (1, 2, 4, 8, 16):
+        client = MSTranslatorClient(endpoint=url, pool_size=concurrency, max_concurrency=concurrency)
+        fn = lambda words: client.map_concurrent(lambda w: client.translate("it", "en", w), words)
+        rows.append(["pooled session", concurrency, f"{lookups_per_second(fn, words):.0f}"])
+    print(f"stub latency {LATENCY * 1000:.0f} ms, {lookups} lookups")
+    print_table(["client", "concurrency", "lookups/s"], rows)
@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import tempfile
+from datetime import date, timedelta
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+PARTS = ["Noun", "Verb (Infinitive)", "Verb (Present)", "Verb (Past)", "Adjective", "Adverb"]
+
+# Point the app at a scratch data/log dir and make the vocab_builder modules importable.
+# Must be called before importing vocab_builder.
+def setup_env():
+    scratch = tempfile.mkdtemp(prefix="vb_bench_")
+    os.environ["VB_DATA_DIR"] = os.path.join(scratch, "data")
+    os.environ["VB_LOGGING_DIR"] = os.path.join(scratch, "logs")
+    sys.path.insert(0, os.path.join(ROOT_DIR, 'vocab_builder'))
+    return scratch
+
+def quiet_logging():
+    logging.getLogger().setLevel(logging.WARNING)
+
+# never_ratio of the entries have never been answered correctly, the rest within the last max_days
+def make_deck(n, seed=0, never_ratio=0.3, max_days=60):
+    rnd = random.Random(seed)
+    today = date.today()
+    deck = {}
+    for i in range(n):
+        last_correct = "" if rnd.random() < never_ratio else (today - timedelta(days=rnd.randint(0, max_days))).isoformat()
+        deck[f"word{i}"] = {
+            "translations": [f"trans{i}_{j}" for j in range(rnd.randint(1, 3))],
+            "lastCorrect": last_correct,
+            "count": 0 if not last_correct else rnd.randint(1, 10),
+            "part": rnd.choice(PARTS)
+        }
+    return deck
+
+def write_deck(filename, deck, meta=None):
+    contents = {"meta": meta, **deck} if meta else deck
+    with open(filename, 'w') as f:
+        f.write(json.dumps(contents))
+
+def vocab_filename(to_lang="xx", from_lang="yy"):
+    return os.path.join(os.environ["VB_DATA_DIR"], f"{to_lang}_{from_lang}_vocab.json")
+
+# Build an initialized VocabBuilder over the given deck, with online lookups disabled unless
+# no_word_lookup=False is passed along with a client
+def new_builder(deck, to_lang="xx", from_lang="yy", client=None, **kwargs):
+    from vocab_builder import VocabBuilder
+    from vocab_store import _stores
+    os.makedirs(os.environ["VB_DATA_DIR"], exist_ok=True)
+    write_deck(vocab_filename(to_lang, from_lang), deck)
+    # Don't reuse a store still holding an earlier deck's unsaved changes
+    _stores.pop(vocab_filename(to_lang, from_lang), None)
+    args = dict(no_trans_check=True, no_word_lookup=True, min_correct=5, min_age=0,
+                part_of_speech="Any", word_order="to-from", from_lang=from_lang, to_lang=to_lang,
+                cli_launch=False)
+    args.update(kwargs)
+    app = VocabBuilder(client=client)
+    app.initialize(**args)
+    quiet_logging()
+    return app
+
+# Sorted wall times of repeat calls to fn() in milliseconds. setup(), if given, runs untimed
+# before each call.
+def time_samples(fn, repeat=5, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup: setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples
+
+# Median wall time of fn() in milliseconds
+def time_ms(fn, repeat=5, setup=None):
+    samples = time_samples(fn, repeat, setup)
+    return samples[len(samples) // 2]
+
+def print_table(header, rows):
+    widths = [max(len(str(r[i])) for r in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths)))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Per-request latency of vocabulary reads and grades, re-parsing the vocab file on every call
+(the previous behaviour) versus serving from the in-memory VocabStore.
+
+usage: benchmarks/bench_vocab_store.py [sizes...]
+"""
+import sys
+import json
+from datetime import date
+from bench_utils import setup_env, make_deck, new_builder, vocab_filename, time_ms, print_table
+
+setup_env()
+
+# Previous get_vocab(): read and parse the whole file on every call
+def legacy_get_vocab(filename):
+    with open(filename, 'r') as f:
+        contents = json.loads(f.read()).items()
+        return dict(filter(lambda el: el[0] != "meta", contents))
+
+# Previous mark_correct() in to-from order: three full parses plus a full rewrite
+def legacy_mark_correct(filename, word):
+    vocab = legacy_get_vocab(filename)
+    key = next(k for k, v in legacy_get_vocab(filename).items() if word in v["translations"])
+    legacy_get_vocab(filename)
+    vocab[key]["count"] += 1
+    vocab[key]["lastCorrect"] = date.today().isoformat()
+    with open(filename, 'w+') as f:
+        f.write(json.dumps(vocab))
+
+def run(size):
+    deck = make_deck(size)
+    app = new_builder(deck)
+    filename = vocab_filename()
+    app.select_words()
+    word = deck[f"word{size // 2}"]["translations"][0]
+    return [
+        size,
+        f"{time_ms(lambda: legacy_get_vocab(filename)):.3f}",
+        f"{time_ms(lambda: app.get_vocab()):.4f}",
+        f"{time_ms(lambda: legacy_mark_correct(filename, word)):.2f}",
+        f"{time_ms(lambda: app.mark_correct(word)):.2f}",
+    ]
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1:]] or [1000, 10000, 100000]
+    print_table(["entries", "read before ms", "read after ms", "grade before ms", "grade after ms"],
+                [run(size) for size in sizes])
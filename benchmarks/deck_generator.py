@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Synthetic vocab decks shaped like a learner's: pseudo-words built from syllables, mostly one or two
+translations per entry with a few shared between entries, parts of speech weighted towards nouns
+and verbs, and study history skewed towards recent days and low counts. Decks are deterministic
+for a given size and seed.
+
+usage: benchmarks/deck_generator.py <size> <output .json or .csv> [seed]
+"""
+import sys
+import csv
+import math
+import random
+from datetime import date
+from bench_utils import write_deck
+
+SYLLABLES = ["ka", "ri", "to", "me", "lu", "sa", "no", "vi", "de", "po", "ga", "chi", "er", "an",
+             "bel", "tor", "mi", "qua", "zo", "ste", "ul", "fa", "ne", "ro", "is", "pra", "gu", "lo"]
+
+# Relative frequencies, as in a typical beginner's deck
+PART_WEIGHTS = {"Subject": 40, "Verb (Infinitive)": 18, "Verb (Past)": 5, "Verb (Past Perfect)": 2,
+                "Verb (Future)": 3, "Adjective": 20, "Adverb": 9, "": 3}
+# Number of translations: 1 for most entries, up to 5
+TRANSLATION_WEIGHTS = {1: 60, 2: 25, 3: 10, 4: 4, 5: 1}
+
+def pseudo_word(rnd, min_syllables=1, max_syllables=4):
+    return "".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(min_syllables, max_syllables)))
+
+def unique_word(rnd, used, max_syllables=4):
+    word = pseudo_word(rnd, 2, max_syllables)
+    if rnd.random() < 0.05:
+        # Short phrases
+        word = f"{word} {pseudo_word(rnd)}"
+    if word in used:
+        word = f"{word}{len(used)}"
+    used.add(word)
+    return word
+
+# Returns {key: {"translations", "lastCorrect", "count", "part"}}. never_ratio of the entries have
+# never been answered correctly. The rest were last correct a number of days ago drawn from an
+# exponential distribution with mean mean_age (capped at a year), with counts that are geometric
+# with mean mean_count.
+def generate_deck(size, seed=0, never_ratio=0.3, mean_age=20, mean_count=3, shared_ratio=0.05):
+    rnd = random.Random(seed)
+    today = date.today().toordinal()
+    parts = rnd.choices(list(PART_WEIGHTS), weights=list(PART_WEIGHTS.values()), k=size)
+    translation_counts = rnd.choices(list(TRANSLATION_WEIGHTS), weights=list(TRANSLATION_WEIGHTS.values()), k=size)
+    keys = set()
+    translations = set()
+    recent = []
+    deck = {}
+    log_p = math.log(1 - 1 / mean_count)
+    for i in range(size):
+        key = unique_word(rnd, keys)
+        entry_translations = []
+        for _ in range(translation_counts[i]):
+            if recent and rnd.random() < shared_ratio:
+                # Synonyms: a translation already used by another entry
+                t = rnd.choice(recent)
+                if t in entry_translations: continue
+            else:
+                t = unique_word(rnd, translations, 3)
+                if len(recent) < 1000: recent.append(t)
+                else: recent[rnd.randrange(1000)] = t
+            entry_translations.append(t)
+        if rnd.random() < never_ratio:
+            last_correct = ""
+            count = 0
+        else:
+            age = min(int(rnd.expovariate(1 / mean_age)), 365)
+            last_correct = date.fromordinal(today - age).isoformat()
+            count = 1 + int(math.log(1 - rnd.random()) / log_p)
+        deck[key] = {"translations": entry_translations, "lastCorrect": last_correct,
+                     "count": count, "part": parts[i]}
+    return deck
+
+# Rows in the import CSV format: to word, part of speech, from words. Of the rows,
+# existing_ratio extend or repeat entries of deck, and untranslated_ratio leave the from words
+# empty so the importer looks them up.
+def generate_import_rows(deck, size, seed=1, existing_ratio=0.2, untranslated_ratio=0.1):
+    rnd = random.Random(seed)
+    keys = list(deck)
+    used = set(deck)
+    rows = []
+    for _ in range(size):
+        r = rnd.random()
+        if keys and r < existing_ratio:
+            key = rnd.choice(keys)
+            entry = deck[key]
+            extra = [pseudo_word(rnd, 2, 3)] if rnd.random() < 0.5 else []
+            rows.append([key, entry["part"], *entry["translations"][:1], *extra])
+        elif r < existing_ratio + untranslated_ratio:
+            rows.append([unique_word(rnd, used), rnd.choice(list(PART_WEIGHTS)), ""])
+        else:
+            rows.append([unique_word(rnd, used), rnd.choice(list(PART_WEIGHTS)),
+                         *(pseudo_word(rnd, 2, 3) for _ in range(rnd.randint(1, 2)))])
+    return rows
+
+def write_csv(filename, rows):
+    with open(filename, 'w') as f:
+        csvwriter = csv.writer(f, quotechar='|', lineterminator='\n', quoting=csv.QUOTE_NONE)
+        csvwriter.writerows(rows)
+
+def deck_rows(deck):
+    return [[k, v["part"], *v["translations"]] for k, v in deck.items()]
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit(__doc__.strip().splitlines()[-1])
+    size = int(sys.argv[1])
+    output = sys.argv[2]
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    deck = generate_deck(size, seed)
+    if output.endswith(".csv"):
+        write_csv(output, deck_rows(deck))
+    else:
+        write_deck(output, deck)
+    print(f"Wrote {len(deck)} entries to {output}")
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import threading
+from bench_utils import ROOT_DIR
+
+sys.path.insert(0, os.path.join(ROOT_DIR, 'vocab_builder'))
+from translator_client import TranslatorClient
+
+LANGS = {"xx": {"name": "Lang X", "nativeName": "Lang X"}, "yy": {"name": "Lang Y", "nativeName": "Lang Y"}}
+
+class FakeTranslatorClient(TranslatorClient):
+    """
+    In-process stand-in for MSTranslatorClient. Every call sleeps latency seconds, as a round trip
+    to the service would, and translate_many() makes one such call per batch of batch_size texts.
+    Translations are deterministic: the text reversed, tagged with the target language. Calls and
+    texts are counted so benchmarks can report service usage.
+    """
+
+    def __init__(self, latency=0.0, batch_size=100, languages=LANGS):
+        self.latency = latency
+        self.batch_size = batch_size
+        self.languages = languages
+        # Benchmarks run without the persistent translation cache
+        self.cache = None
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.texts = 0
+
+    def call(self, texts):
+        with self.lock:
+            self.calls += 1
+            self.texts += texts
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_languages(self):
+        self.call(0)
+        return self.languages
+
+    def detect_language(self, text):
+        self.call(1)
+        return [{"language": "xx", "score": 1.0, "isTranslationSupported": True}]
+
+    def translate(self, from_lang, to_lang, text):
+        self.call(1)
+        return f"{to_lang}:{text[::-1]}"
+
+    def translate_many(self, from_lang, to_lang, texts):
+        texts = list(dict.fromkeys(texts))
+        result = {}
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i:i + self.batch_size]
+            self.call(len(batch))
+            result.update((text, f"{to_lang}:{text[::-1]}") for text in batch)
+        return result
+
+    def stats(self):
+        return {"calls": self.calls, "texts": self.texts}
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Load test for the multi-session server: opens a growing number of learner sessions over one
+vocabulary, starts a quiz in each, then sends next_word/mark_correct requests round-robin across
+them through the Flask app. Reports request latency, live sessions, evictions and process RSS.
+Sessions past VB_MAX_SESSIONS or VB_SESSION_MAX_POOL_MB are evicted least recently used first; a
+request to an evicted session gets "Not Initialized", and the learner restarts its quiz.
+
+usage: benchmarks/load_sessions.py [deck size] [requests per level] [sessions ...]
+"""
+import os
+import sys
+import time
+import resource
+from bench_utils import setup_env, make_deck, write_deck, vocab_filename, quiet_logging, print_table
+
+setup_env()
+
+LANGS = {"xx": {"name": "Lang X", "nativeName": "Lang X"}, "yy": {"name": "Lang Y", "nativeName": "Lang Y"}}
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        # Peak rather than current RSS; kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    levels = [int(a) for a in sys.argv[3:]] or [1, 10, 100, 500]
+    os.makedirs(os.environ["VB_DATA_DIR"], exist_ok=True)
+    write_deck(vocab_filename(), make_deck(size))
+    import server
+    quiet_logging()
+    server.shared.client.get_languages = lambda: LANGS
+    client = server.api.test_client()
+    init = "/init?from_lang=yy&to_lang=xx&min_correct=5&min_age=0&part_of_speech=Any"
+    def start_quiz(token):
+        client.get(f"{init}&session={token}")
+        client.get(f"/vocab/select_words?session={token}")
+
+    tokens = []
+    rows = []
+    for level in levels:
+        while len(tokens) < level:
+            token = client.get("/session/new").get_json()["Session"]
+            start_quiz(token)
+            tokens.append(token)
+        samples = []
+        restarts = 0
+        start = time.perf_counter()
+        for i in range(count):
+            token = tokens[i % level]
+            t = time.perf_counter()
+            word = client.get(f"/vocab/next_word?session={token}").get_json()
+            if word and "Error" in word:
+                restarts += 1
+                start_quiz(token)
+            elif word and i % 4 == 0:
+                client.post(f"/vocab/mark_correct?session={token}", json={"text": word["text"]})
+            samples.append((time.perf_counter() - t) * 1000)
+        elapsed = time.perf_counter() - start
+        samples.sort()
+        stats = server.sessions.stats()
+        rows.append([level, stats["sessions"], stats["evictions"], restarts, f"{count / elapsed:.0f}",
+                     f"{percentile(samples, 0.5):.2f}", f"{percentile(samples, 0.99):.2f}",
+                     f"{stats['pool_bytes'] / (1024 * 1024):.1f}", f"{rss_mb():.0f}"])
+    print(f"deck: {size} entries, {count} requests per level")
+    print_table(["sessions", "live", "evicted", "restarts", "req/s", "p50 ms", "p99 ms", "pools MB", "RSS MB"], rows)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: times the VocabBuilder operations and the main server endpoints over synthetic
+decks of each size, with a FakeTranslatorClient standing in for the translation service. Results
+are written as JSON, one record per (benchmark, size), and can be compared with an earlier run's
+file to catch regressions; the exit status is 1 if any benchmark slowed down past the threshold.
+
+usage: benchmarks/run_suite.py [--sizes 1000,10000,100000] [--repeat 5] [--latency-ms 20]
+                               [--output results.json] [--compare baseline.json] [--threshold 0.25]
+                               [--min-ms 0.5]
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from itertools import islice
+from bench_utils import setup_env, new_builder, write_deck, vocab_filename, quiet_logging, time_samples, print_table, ROOT_DIR
+
+setup_env()
+from deck_generator import generate_deck, generate_import_rows, write_csv
+from fake_translator import FakeTranslatorClient
+
+# Words quizzed, merged and added per timed sample
+ROUNDS = 20
+MERGE_WORDS = 200
+# Import rows, as a fraction of the deck size
+IMPORT_RATIO = 0.1
+MAX_IMPORT_ROWS = 20000
+# Where results go unless --output is given
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+def record(results, group, name, size, samples, per=1):
+    results.append({"group": group, "name": name, "size": size,
+                    "median_ms": round(samples[len(samples) // 2] / per, 4),
+                    "min_ms": round(samples[0] / per, 4), "max_ms": round(samples[-1] / per, 4),
+                    "samples": len(samples)})
+
+# In from-to order the quiz shows a translation, and the learner answers with its entry's key
+def answers(deck):
+    return {t: k for k, v in deck.items() for t in v["translations"]}
+
+def bench_builder(results, size, deck, client, repeat):
+    app = new_builder(deck, client=client, no_word_lookup=False, word_order="from-to")
+    answer = answers(deck)
+    record(results, "builder", "get_vocab", size, time_samples(app.get_vocab, repeat))
+    record(results, "builder", "select_words", size, time_samples(app.select_words, repeat))
+
+    def quiz():
+        for _ in range(ROUNDS):
+            word = app.next_word()
+            if word is None:
+                app.select_words()
+                continue
+            app.mark_correct(answer[word["text"]])
+    app.select_words()
+    record(results, "builder", "next_word+mark_correct", size, time_samples(quiz, repeat), per=ROUNDS)
+
+    incoming = iter(generate_import_rows(deck, MERGE_WORDS * repeat, seed=size, untranslated_ratio=0))
+    def merge():
+        words = [(",".join(row[2:]), row[0], row[1]) for row in islice(incoming, MERGE_WORDS)]
+        app.merge_vocab(words)
+    record(results, "builder", f"merge_vocab ({MERGE_WORDS} words)", size, time_samples(merge, repeat))
+
+    rows = generate_import_rows(deck, min(int(size * IMPORT_RATIO), MAX_IMPORT_ROWS) or 1, seed=size + 1)
+    filename = os.path.join(os.environ["VB_DATA_DIR"], "suite_import.csv")
+    write_csv(filename, rows)
+    calls = client.calls
+    # Each import changes the vocab the next one merges into, so it is timed once
+    samples = time_samples(lambda: app.import_vocab_csv(filename=filename), 1)
+    record(results, "builder", f"import_vocab_csv ({len(rows)} rows)", size, samples)
+    results[-1]["translator_calls"] = client.calls - calls
+
+    record(results, "builder", "save_vocab_csv", size, time_samples(app.save_vocab_csv, repeat))
+
+def bench_endpoints(results, size, deck, server, repeat):
+    from vocab_store import _stores
+    write_deck(vocab_filename(), deck)
+    _stores.pop(vocab_filename(), None)
+    c = server.api.test_client()
+    token = c.get("/session/new").get_json()["Session"]
+    headers = {"X-VB-Session": token}
+    def get(url, **kwargs):
+        return c.get(url, headers={**headers, **kwargs.pop("extra", {})}, **kwargs)
+    def post(url, body):
+        return c.post(url, json=body, headers=headers)
+
+    init = "/init?from_lang=yy&to_lang=xx&min_correct=5&min_age=0&part_of_speech=Any"
+    record(results, "endpoint", "GET /init", size, time_samples(lambda: get(init), repeat))
+    record(results, "endpoint", "GET /vocab/select_words", size, time_samples(lambda: get("/vocab/select_words"), repeat))
+
+    words = []
+    def next_word():
+        words.append(get("/vocab/next_word").get_json())
+    record(results, "endpoint", "GET /vocab/next_word", size, time_samples(next_word, repeat))
+    answer = answers(deck)
+    texts = iter([answer[w["text"]] for w in words if w] * 2)
+    record(results, "endpoint", "POST /vocab/mark_correct", size,
+           time_samples(lambda: post("/vocab/mark_correct", {"text": next(texts, "")}), repeat))
+
+    added = iter(range(repeat * 2))
+    def change():
+        i = next(added)
+        post("/vocab/add_entry", {"from": f"suite{i}", "to": f"suiteword{i}", "part_of_speech": "Subject"})
+    record(results, "endpoint", "POST /vocab/add_entry", size, time_samples(change, repeat))
+    # Full vocab, rebuilt after each change, then served from the response cache
+    record(results, "endpoint", "GET /vocab/get_all", size, time_samples(lambda: get("/vocab/get_all"), repeat, setup=change))
+    record(results, "endpoint", "GET /vocab/get_all (cached)", size, time_samples(lambda: get("/vocab/get_all"), repeat))
+    etag = get("/vocab/get_all").headers.get("ETag")
+    record(results, "endpoint", "GET /vocab/get_all (304)", size,
+           time_samples(lambda: get("/vocab/get_all", extra={"If-None-Match": etag}), repeat))
+    record(results, "endpoint", "GET /vocab/get_all?limit=100", size,
+           time_samples(lambda: get("/vocab/get_all?limit=100&sort=count&order=desc"), repeat))
+    # The body is streamed from the export file, so read it all
+    record(results, "endpoint", "GET /vocab/download_csv", size,
+           time_samples(lambda: get("/vocab/download_csv").get_data(), repeat))
+    record(results, "endpoint", "GET /languages/get", size, time_samples(lambda: get("/languages/get"), repeat))
+    post("/session/end", {})
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+# Print each benchmark against the baseline run. Returns the records that slowed down by more
+# than threshold, as a fraction of the baseline median, and by at least min_ms, so that timer
+# noise on sub-millisecond benchmarks isn't reported.
+def compare(results, baseline, threshold, min_ms):
+    previous = {(r["name"], r["size"]): r for r in baseline["results"]}
+    rows = []
+    regressions = []
+    for r in results:
+        before = previous.get((r["name"], r["size"]), None)
+        if before is None or not before["median_ms"]: continue
+        change = r["median_ms"] / before["median_ms"] - 1
+        flag = ""
+        if change > threshold and r["median_ms"] - before["median_ms"] >= min_ms:
+            flag = "REGRESSION"
+            regressions.append(r)
+        elif change < -threshold and before["median_ms"] - r["median_ms"] >= min_ms:
+            flag = "faster"
+        rows.append([r["name"], r["size"], f"{before['median_ms']:.3f}", f"{r['median_ms']:.3f}", f"{change:+.0%}", flag])
+    print_table(["benchmark", "size", "baseline ms", "ms", "change", ""], rows)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time VocabBuilder operations and server endpoints over synthetic decks.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated deck sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="timed samples per benchmark")
+    parser.add_argument("--latency-ms", type=float, default=20, help="fake translator round trip")
+    parser.add_argument("--output", default=None, help="results file (default benchmarks/results/suite-<date>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="slowdown reported as a regression")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="smallest slowdown in ms reported as a regression")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("suite-%Y%m%d-%H%M%S.json"))
+
+    os.makedirs(os.environ["VB_DATA_DIR"], exist_ok=True)
+    client = FakeTranslatorClient(latency=args.latency_ms / 1000)
+    import server
+    quiet_logging()
+    server.shared.client = server.shared.catalog.client = client
+
+    results = []
+    for size in sizes:
+        deck = generate_deck(size)
+        bench_builder(results, size, deck, client, args.repeat)
+        bench_endpoints(results, size, deck, server, args.repeat)
+
+    run = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "persistence": os.environ.get("VB_PERSISTENCE", "snapshot"),
+            "sizes": sizes,
+            "repeat": args.repeat,
+            "latency_ms": args.latency_ms,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(run, f, indent=2)
+
+    print_table(["benchmark", "size", "median ms", "min ms", "max ms"],
+                [[r["name"], r["size"], f"{r['median_ms']:.3f}", f"{r['min_ms']:.3f}", f"{r['max_ms']:.3f}"] for r in results])
+    print(f"Results written to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_ms)
+        if regressions:
+            print(f"{len(regressions)} benchmarks slowed down by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
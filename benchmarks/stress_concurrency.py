@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Stress test for the store's concurrency model. Writer threads repeatedly set every entry's count
+to a new generation number inside one writing() block and save. Reader threads take snapshots,
+run paged queries and, in snapshot persistence, parse the vocab file from disk, and check that each view is consistent,
+i.e. that all its counts come from a single generation.
+
+With --legacy, readers use the live entries and writers rewrite the file in place, as before,
+to show the torn reads this prevents.
+
+usage: benchmarks/stress_concurrency.py [seconds] [deck size] [readers] [writers] [--legacy]
+"""
+import sys
+import json
+import time
+import threading
+from bench_utils import setup_env, make_deck, new_builder, vocab_filename, print_table
+
+setup_env()
+from vocab_store import PERSISTENCE
+from vocab_entry import entry_json
+
+def consistent(entries):
+    return len({e["count"] for e in entries}) <= 1
+
+if __name__ == "__main__":
+    legacy = "--legacy" in sys.argv
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    seconds = float(args[0]) if len(args) > 0 else 5
+    size = int(args[1]) if len(args) > 1 else 5000
+    readers = int(args[2]) if len(args) > 2 else 4
+    writers = int(args[3]) if len(args) > 3 else 2
+    app = new_builder(make_deck(size))
+    store = app.store
+    keys = list(store.keys())
+    filename = vocab_filename()
+    counts = {name: 0 for name in ("writes", "snapshots", "queries", "file reads")}
+    errors = {name: 0 for name in ("torn snapshots", "torn queries", "torn files", "unreadable files", "exceptions")}
+    generation = [0]
+    gen_lock = threading.Lock()
+    stop = threading.Event()
+
+    def legacy_write():
+        with open(filename, 'w+') as f:
+            f.write(json.dumps(store.entries, default=entry_json))
+
+    def writer():
+        while not stop.is_set():
+            with gen_lock:
+                generation[0] += 1
+                g = generation[0]
+            if legacy:
+                for key in keys:
+                    # Changes the stored entry in place, as writers did before copy-on-write
+                    store.entries[key].count = g
+                legacy_write()
+            else:
+                with store.writing():
+                    for key in keys:
+                        entry = store.get_mutable(key)
+                        entry["count"] = g
+                        store.put(key, entry)
+                    store.save()
+            counts["writes"] += 1
+
+    def reader(i):
+        while not stop.is_set():
+            try:
+                if i % 3 == 0:
+                    view = store.entries if legacy else store.snapshot()
+                    if not consistent(list(view.values())): errors["torn snapshots"] += 1
+                    counts["snapshots"] += 1
+                elif i % 3 == 1:
+                    page = app.query_vocab(sort="count", limit=size) if not legacy else \
+                      [dict(e) for e in store.entries.values()]
+                    entries = page["entries"] if not legacy else page
+                    if not consistent(entries): errors["torn queries"] += 1
+                    counts["queries"] += 1
+                elif PERSISTENCE == "snapshot":
+                    with open(filename) as f:
+                        data = f.read()
+                    try:
+                        contents = json.loads(data)
+                    except ValueError:
+                        errors["unreadable files"] += 1
+                        continue
+                    contents.pop("meta", None)
+                    if not consistent(contents.values()): errors["torn files"] += 1
+                    counts["file reads"] += 1
+            except Exception:
+                errors["exceptions"] += 1
+
+    # Generation 0, so the views are consistent from the start
+    with store.writing():
+        for key in keys:
+            entry = store.get_mutable(key)
+            entry["count"] = 0
+            store.put(key, entry)
+        store.save()
+    store.snapshot()
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)] + \
+      [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for t in threads: t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads: t.join()
+    print(f"{'legacy' if legacy else 'copy-on-write'} mode, {PERSISTENCE} persistence: {size} entries, {readers} readers, {writers} writers, {seconds:g}s")
+    print_table(["operation", "count"], [[k, v] for k, v in counts.items()])
+    print_table(["failure", "count"], [[k, v] for k, v in errors.items()])
+    if not legacy and any(errors.values()):
+        sys.exit(1)
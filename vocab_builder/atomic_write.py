@@ -0,0 +1,26 @@
+import os
+import uuid
+from contextlib import contextmanager
+
+# Open filename for writing through a temporary file in the same directory, which replaces
+# filename only once the with block completes. Readers see either the old contents or the new,
+# never a partly written file, and a failed write leaves the old file in place.
+#   with atomic_write(path) as f:
+#       f.write(data)
+# opener is called as opener(temp path, mode), e.g. gzip.open.
+@contextmanager
+def atomic_write(filename, mode='w', opener=open, fsync=False):
+    tmp = f"{filename}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with opener(tmp, mode) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
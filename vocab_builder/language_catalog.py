@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from os.path import exists, dirname
+
+from atomic_write import atomic_write
+
+# Seconds before the cached catalog is refreshed from the translation service
+CATALOG_TTL = float(os.environ.get("VB_LANGUAGE_CATALOG_TTL", 7 * 24 * 3600))
+
+# True on the gevent server's hub thread, where blocking stalls every request
+def on_gevent_hub():
+    return "gevent" in sys.modules and threading.current_thread() is threading.main_thread()
+
+class LanguageCatalog():
+    """
+    The translation service's language list, cached on disk as {"fetched": <epoch secs>,
+    "languages": {code: {"name", "nativeName", ...}}}. Once a copy exists, languages() never waits
+    on the network: a stale copy is served while a background thread refreshes it.
+
+    Codes, names and native names are indexed so to_id() is a dict lookup.
+    """
+
+    def __init__(self, filename, client, ttl=CATALOG_TTL):
+        self.filename = filename
+        self.client = client
+        self.ttl = ttl
+        self.langs = {}
+        self.ids = {}
+        self.fetched = 0
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.refreshing = False
+        # Held while loading or, with no copy to serve, fetching, so concurrent callers wait for
+        # one fetch rather than each making their own. Callers on the gevent server's hub don't
+        # wait, see languages().
+        self.fetch_lock = threading.Lock()
+
+    def languages(self):
+        if not self.loaded or not self.langs:
+            # The server's greenlets share one thread, and the fetch yields between retries, so
+            # blocking on the lock there could wait on a greenlet that never gets to run again.
+            # They get whatever is cached, possibly nothing, until the fetch is done.
+            if not self.fetch_lock.acquire(blocking=not on_gevent_hub()):
+                return self.langs
+            try:
+                if not self.loaded:
+                    self.load()
+                if not self.langs:
+                    self.refresh()
+            finally:
+                self.fetch_lock.release()
+        if self.langs and time.time() - self.fetched > self.ttl:
+            self.refresh_in_background()
+        return self.langs
+
+    def to_id(self, lang):
+        self.languages()
+        return self.ids.get(lang, None)
+
+    def load(self):
+        self.loaded = True
+        if not exists(self.filename): return
+        try:
+            with open(self.filename, 'r') as f:
+                contents = json.load(f)
+            self.index(contents["languages"], contents.get("fetched", 0))
+        except Exception as e:
+            logging.error(f"Unable to read language catalog {self.filename}: {e}")
+
+    # Fetch the catalog from the service. On failure the cached copy is kept.
+    def refresh(self):
+        langs = self.client.get_languages()
+        if not langs:
+            logging.error("Unable to fetch the language catalog")
+            return False
+        self.index(langs, time.time())
+        try:
+            os.makedirs(dirname(self.filename), exist_ok=True)
+            with atomic_write(self.filename) as f:
+                f.write(json.dumps({"fetched": self.fetched, "languages": langs}))
+        except OSError as e:
+            logging.error(f"Unable to save language catalog {self.filename}: {e}")
+        return True
+
+    def refresh_in_background(self):
+        with self.lock:
+            if self.refreshing: return
+            self.refreshing = True
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self.refreshing = False
+        threading.Thread(target=run, daemon=True).start()
+
+    def index(self, langs, fetched):
+        ids = {}
+        for code, lang in langs.items():
+            for name in (lang.get("nativeName", None), lang.get("name", None)):
+                if name: ids[name] = code
+        for code in langs:
+            ids[code] = code
+        self.langs = langs
+        self.ids = ids
+        self.fetched = fetched
@@ -1,3 +1,24 @@
+import os
+import queue
+import atexit
+import logging
+from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+
+# Levels by logging level name. VB_LOG_LEVEL sets the least severe level recorded at all;
+# VB_CONSOLE_LOG_LEVEL and VB_FILE_LOG_LEVEL can raise it for one destination.
+LOG_LEVEL = os.environ.get("VB_LOG_LEVEL", "INFO").upper()
+CONSOLE_LOG_LEVEL = os.environ.get("VB_CONSOLE_LOG_LEVEL", "DEBUG").upper()
+FILE_LOG_LEVEL = os.environ.get("VB_FILE_LOG_LEVEL", "DEBUG").upper()
+# The log file is rotated when it reaches VB_LOG_MAX_BYTES, keeping VB_LOG_BACKUPS old files
+LOG_MAX_BYTES = int(os.environ.get("VB_LOG_MAX_BYTES", 5 * 1024 * 1024))
+LOG_BACKUPS = int(os.environ.get("VB_LOG_BACKUPS", 3))
+# Forked server workers append to the same log file. Each would roll it over on its own, renaming
+# the file from under the others, so it isn't rotated then.
+SHARED = int(os.environ.get("VB_WORKERS", 1)) > 1 and hasattr(os, "fork")
+# VB_LOG_QUEUE=off writes log records from the logging thread, as before the queue was added
+LOG_QUEUE = os.environ.get("VB_LOG_QUEUE", "on").lower() not in ("off", "0", "false")
+
 def config(file_name):
   return {
         "version": 1,
@@ -10,13 +31,56 @@ def config(file_name):
         "handlers": {
             "console": {
                 "class": "logging.StreamHandler",
-                "formatter": "default"
+                "formatter": "default",
+                "level": CONSOLE_LOG_LEVEL
             },
             "file": {
-                "class": "logging.FileHandler",
+                "class": "logging.handlers.RotatingFileHandler",
                 "filename": file_name,
-                "formatter": "default"
+                "maxBytes": 0 if SHARED else LOG_MAX_BYTES,
+                "backupCount": LOG_BACKUPS,
+                "encoding": "utf-8",
+                "formatter": "default",
+                "level": FILE_LOG_LEVEL
             }
         },
-        "root": {"level": "DEBUG", "handlers": ["console", "file"]}
-}
\ No newline at end of file
+        "root": {"level": LOG_LEVEL, "handlers": ["console", "file"]}
+}
+
+listener = None
+
+# Configure logging from config(file_name). Unless VB_LOG_QUEUE=off, the root logger only puts
+# records on a queue, and a background thread formats them and writes them to the console and
+# the log file, so a request never waits on log I/O.
+def configure(file_name):
+  global listener
+  dictConfig(config(file_name))
+  if not LOG_QUEUE: return
+  root = logging.getLogger()
+  handlers = list(root.handlers)
+  for handler in handlers:
+    root.removeHandler(handler)
+  log_queue = queue.SimpleQueue()
+  root.addHandler(QueueHandler(log_queue))
+  listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+  listener.start()
+  atexit.register(stop)
+  # A forked child has no listener thread: give it a queue and thread of its own
+  if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=restart_in_child)
+
+# Write out the records still queued and stop the thread
+def stop():
+  global listener
+  if listener is not None:
+    listener.stop()
+    listener = None
+
+def restart_in_child():
+  global listener
+  if listener is None: return
+  log_queue = queue.SimpleQueue()
+  for handler in logging.getLogger().handlers:
+    if isinstance(handler, QueueHandler): handler.queue = log_queue
+  listener = QueueListener(log_queue, *listener.handlers, respect_handler_level=True)
+  listener.start()
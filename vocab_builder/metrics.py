@@ -0,0 +1,160 @@
+import os
+import time
+import bisect
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# VB_METRICS=off turns recording into a no-op
+ENABLED = os.environ.get("VB_METRICS", "on").lower() not in ("off", "0", "false")
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name -> (type, help)
+FAMILIES = {
+    "vb_request_seconds": ("histogram", "Time to handle HTTP requests, by route and method"),
+    "vb_request_errors_total": ("counter", "Requests that raised, returned an error body or an error status"),
+    "vb_operation_seconds": ("histogram", "Time spent in vocab, import/export and translator operations"),
+    "vb_operation_errors_total": ("counter", "Operations that raised or, for translator calls, got an error status"),
+    "vb_bytes_read_total": ("counter", "Bytes read from data files, by kind"),
+    "vb_bytes_written_total": ("counter", "Bytes written to data files, by kind"),
+    "vb_translator_chars_total": ("counter", "Characters sent to the translation service"),
+}
+
+class Histogram():
+    __slots__ = ("buckets", "count", "sum")
+
+    def __init__(self):
+        # Per-bucket counts, with a final bucket for observations past the last bound
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    # Estimate of the q quantile, interpolated within its bucket
+    def quantile(self, q):
+        if not self.count: return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if seen + n >= rank and n:
+                if i == len(BUCKETS): return BUCKETS[-1]
+                low = BUCKETS[i - 1] if i else 0.0
+                return low + (BUCKETS[i] - low) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+class Metrics():
+    """
+    In-process counters and latency histograms, exported in the Prometheus text format or as a
+    dict for JSON. Series are keyed by family name and a tuple of (label, value) pairs. Recording
+    is a dict lookup and a few additions under a lock, cheap enough to leave on.
+
+    Each process keeps its own metrics, so with several server workers a scrape sees the worker
+    that served it.
+    """
+
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def observe(self, family, seconds, **labels):
+        if not self.enabled: return
+        key = (family, tuple(labels.items()))
+        with self.lock:
+            histogram = self.histograms.get(key, None)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def add(self, family, amount=1, **labels):
+        if not self.enabled or not amount: return
+        key = (family, tuple(labels.items()))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    # Time the with block as an operation, counting an error if it raises
+    @contextmanager
+    def timer(self, operation):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.add("vb_operation_errors_total", operation=operation)
+            raise
+        finally:
+            self.observe("vb_operation_seconds", time.perf_counter() - start, operation=operation)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def prometheus(self):
+        with self.lock:
+            histograms = {k: (list(h.buckets), h.count, h.sum) for k, h in self.histograms.items()}
+            counters = dict(self.counters)
+        lines = []
+        for family, (kind, description) in FAMILIES.items():
+            series = sorted((k[1], v) for k, v in (histograms if kind == "histogram" else counters).items() if k[0] == family)
+            if not series: continue
+            lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {kind}")
+            for labels, value in series:
+                if kind == "counter":
+                    lines.append(f"{family}{format_labels(labels)} {value}")
+                    continue
+                buckets, count, total = value
+                cumulative = 0
+                for bound, n in zip(BUCKETS, buckets):
+                    cumulative += n
+                    lines.append(f"{family}_bucket{format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{family}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{family}_sum{format_labels(labels)} {total:.6f}")
+                lines.append(f"{family}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    # Summary for JSON: per series counts, total and mean seconds and estimated p50/p95/p99 in ms
+    def as_dict(self):
+        with self.lock:
+            result = {"started": self.started, "uptime": time.time() - self.started}
+            for (family, labels), h in sorted(self.histograms.items()):
+                result.setdefault(family, []).append({
+                    **dict(labels), "count": h.count, "sum_seconds": round(h.sum, 6),
+                    "mean_ms": round(h.sum / h.count * 1000, 3),
+                    **{f"p{round(q * 100)}_ms": round(h.quantile(q) * 1000, 3) for q in (0.5, 0.95, 0.99)}})
+            for (family, labels), value in sorted(self.counters.items()):
+                result.setdefault(family, []).append({**dict(labels), "value": value})
+        return result
+
+def format_labels(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+# The process's metrics, shared by the server, the vocab stores and the translator client
+metrics = Metrics()
+
+# Decorator recording each call as the named operation
+def timed(operation):
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with metrics.timer(operation):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
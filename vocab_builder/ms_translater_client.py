@@ -1,40 +1,153 @@
-import requests
 import os
 import re
 import sys
 import json
+import time
 import uuid
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from translator_client import TranslatorClient
+from metrics import metrics
 
-endpoint = "https://api.cognitive.microsofttranslator.com"
+endpoint = os.environ.get("VB_TRANSLATOR_ENDPOINT", "https://api.cognitive.microsofttranslator.com")
 location = "eastus"
 params = {
     'api-version': '3.0'
 }
+# Per-request limits of the /translate call
+MAX_BATCH_ELEMENTS = 100
+MAX_BATCH_CHARS = 10000
+# Keep-alive connections held open to the service
+POOL_SIZE = int(os.environ.get("VB_TRANSLATOR_POOL_SIZE", 8))
+# Lookups allowed in flight at once
+MAX_CONCURRENCY = int(os.environ.get("VB_TRANSLATOR_CONCURRENCY", 4))
+# Retries after a connection error, a 429 or a 5xx, with jittered exponential backoff
+MAX_RETRIES = int(os.environ.get("VB_TRANSLATOR_RETRIES", 3))
+# Seconds a call may take, retries included, before the last failure is returned. Lookups run while
+# a request waits, so this stays short.
+RETRY_BUDGET = float(os.environ.get("VB_TRANSLATOR_RETRY_BUDGET", 1.0))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Sleep without blocking the gevent server's other requests when called on its hub thread. The
+# server doesn't monkey-patch, so time.sleep there would stall every client.
+def sleep(seconds):
+  gevent = sys.modules.get("gevent", None)
+  if gevent is not None and threading.current_thread() is threading.main_thread():
+    gevent.sleep(seconds)
+  else:
+    time.sleep(seconds)
 
 class MSTranslatorClient(TranslatorClient):
   
-  def __init__(self, api_key_file=''):
+  def __init__(self, api_key_file='', endpoint=endpoint, pool_size=POOL_SIZE, max_concurrency=MAX_CONCURRENCY,
+               max_retries=MAX_RETRIES, retry_budget=RETRY_BUDGET, cache=None):
     self.api_key = None
+    # Optional TranslationCache consulted before calling the service
+    self.cache = cache
     self.api_key_file = api_key_file
+    self.endpoint = endpoint
+    self.max_concurrency = max_concurrency
+    self.max_retries = max_retries
+    self.retry_budget = retry_budget
+    self.pool_size = pool_size
+    # Created on first use, so starting the app doesn't wait on importing requests
+    self.session = None
+    self.session_lock = threading.Lock()
+    self.executor = None
+    self.executor_lock = threading.Lock()
     
   def has_api_key(self):
     return self.api_key is not None
   
+  # The pooled keep-alive session, created on the first request
+  def get_session(self):
+    with self.session_lock:
+      if self.session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+          'Ocp-Apim-Subscription-Region': location,
+          'Content-type': 'application/json'
+        })
+        self.session = session
+    return self.session
+
+  # Per-request headers. The static ones live on the session.
   def headers(self):
     return  {
       'Ocp-Apim-Subscription-Key': self.api_key,
-      'Ocp-Apim-Subscription-Region': location,
-      'Content-type': 'application/json',
       'X-ClientTraceId': str(uuid.uuid4())
     }
 
+  # Send a request on the pooled session, retrying transient failures while the retry budget
+  # lasts. Raises the last connection error once retries are exhausted, or at once if the service
+  # can't be reached at all. Each attempt is recorded as a translator operation.
+  def request(self, method, path, **kwargs):
+      url = self.endpoint + path
+      operation = f"translator {path.split('?')[0]}"
+      body = kwargs.get('json', None)
+      chars = sum(len(item.get("text", "")) for item in body) if isinstance(body, list) else 0
+      session = self.get_session()
+      import requests
+      from urllib3.exceptions import NewConnectionError
+      deadline = time.monotonic() + self.retry_budget
+      attempt = 0
+      while True:
+          metrics.add("vb_translator_chars_total", chars, operation=operation)
+          try:
+              with metrics.timer(operation):
+                  response = session.request(method, url, headers=self.headers(), timeout=5.0, **kwargs)
+              if response.status_code >= 400:
+                  metrics.add("vb_operation_errors_total", operation=operation)
+              if response.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                  return response
+              delay = self.backoff(attempt, response.headers.get('Retry-After', None))
+              if time.monotonic() + delay > deadline:
+                  return response
+          except (requests.ConnectionError, requests.Timeout) as e:
+              # Offline or a bad endpoint: retrying would only hold up the request
+              unreachable = isinstance(getattr(e.args[0] if e.args else None, 'reason', None), NewConnectionError)
+              if attempt >= self.max_retries or unreachable:
+                  raise
+              delay = self.backoff(attempt)
+              if time.monotonic() + delay > deadline:
+                  raise
+          attempt += 1
+          sleep(delay)
+
+  # Full-jitter exponential backoff, or the server's Retry-After if it sent one
+  def backoff(self, attempt, retry_after=None):
+      if retry_after is not None:
+          try:
+              return min(float(retry_after), BACKOFF_MAX)
+          except ValueError:
+              pass
+      return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+  # Apply fn to each item on the worker pool, at most max_concurrency at a time. Results keep
+  # the order of items.
+  def map_concurrent(self, fn, items):
+      items = list(items)
+      if len(items) <= 1 or self.max_concurrency <= 1:
+          return [fn(item) for item in items]
+      with self.executor_lock:
+          if self.executor is None:
+              self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="translator")
+      return list(self.executor.map(fn, items))
+
   def get_languages(self):
       path = '/languages'
-      url = endpoint + path
       try:
-          request = requests.get(url, params=params, headers=self.headers(), timeout=5.0)
+          request = self.request('GET', path, params=params)
           response = request.json()
           return response['translation']
       except:
@@ -69,22 +182,30 @@ class MSTranslatorClient(TranslatorClient):
       
   def detect_language(self, text):
       path = '/detect?api-version=3.0'
-      url = endpoint + path
       body = [{
           "text": "'" + text + "'"
       }]
       try:
-          request = requests.post(url, headers=self.headers(), json=body, timeout=5.0)
+          request = self.request('POST', path, json=body)
           response = request.json()
           # print(json.dumps(response, sort_keys=True, indent=4, ensure_ascii=False, separators=(',', ': ')))
           return response
       except Exception as e:
-          print(e)
+          logging.error("Language detection failed: %r", e)
           return None
   
   def translate(self, from_lang, to_lang, text):
+      if self.cache is not None:
+          cached = self.cache.get(from_lang, to_lang, text)
+          if cached is not None:
+              return cached
+      translation = self.translate_uncached(from_lang, to_lang, text)
+      if self.cache is not None and translation is not None:
+          self.cache.put(from_lang, to_lang, text, translation)
+      return translation
+
+  def translate_uncached(self, from_lang, to_lang, text):
       path = '/translate?api-version=3.0'
-      url = endpoint + path
       params = {
           "from": from_lang,
           "to": to_lang
@@ -93,17 +214,67 @@ class MSTranslatorClient(TranslatorClient):
           "text": "'" + text + "'"
       }]
       try:
-          request = requests.post(url, params=params, headers=self.headers(), json=body, timeout=5.0)
+          request = self.request('POST', path, params=params, json=body)
           response = request.json()
           # print(json.dumps(response, sort_keys=True, indent=4, ensure_ascii=False, separators=(',', ': ')))
           if not isinstance(response, list):
-            print("Unable to obtain a translation from the service. Most likely, the API key is not valid or the account " +
-                  "is not subscrined to the translation service")
+            logging.error("Unable to obtain a translation from the service. Most likely, the API key is not valid or the account " +
+                          "is not subscribed to the translation service")
             return None
           text = response[0]["translations"][0]["text"]
           return re.sub("^'", "", re.sub("'$", "", text))
       except Exception as e:
-          print(repr(e))
+          logging.error("Translation failed: %r", e)
+          return None
+
+  # Translate many texts with one /translate call per batch, running batches concurrently.
+  # Identical texts are sent once. Returns {text: translation}, omitting texts whose batch failed.
+  def translate_many(self, from_lang, to_lang, texts):
+      texts = list(dict.fromkeys(texts))
+      result = self.cache.get_many(from_lang, to_lang, texts) if self.cache is not None else {}
+      batches = list(self.batches([text for text in texts if text not in result]))
+      fetched = {}
+      for batch, translations in zip(batches, self.map_concurrent(
+          lambda batch: self.translate_batch(from_lang, to_lang, batch), batches)):
+          if translations is not None:
+              fetched.update(zip(batch, translations))
+      if self.cache is not None and fetched:
+          self.cache.put_many(from_lang, to_lang, fetched)
+      result.update(fetched)
+      return result
+
+  # Split texts into batches within the service's element and character limits
+  def batches(self, texts):
+      batch = []
+      chars = 0
+      for text in texts:
+          size = len(text) + 2
+          if batch and (len(batch) == MAX_BATCH_ELEMENTS or chars + size > MAX_BATCH_CHARS):
+              yield batch
+              batch = []
+              chars = 0
+          batch.append(text)
+          chars += size
+      if batch:
+          yield batch
+
+  def translate_batch(self, from_lang, to_lang, texts):
+      path = '/translate?api-version=3.0'
+      params = {
+          "from": from_lang,
+          "to": to_lang
+      }
+      body = [{"text": "'" + text + "'"} for text in texts]
+      try:
+          request = self.request('POST', path, params=params, json=body)
+          response = request.json()
+          if not isinstance(response, list) or len(response) != len(texts):
+            logging.error("Unable to obtain a translation from the service. Most likely, the API key is not valid or the account " +
+                          "is not subscribed to the translation service")
+            return None
+          return [re.sub("^'", "", re.sub("'$", "", item["translations"][0]["text"])) for item in response]
+      except Exception as e:
+          logging.error("Translation failed: %r", e)
           return None
 """
 resp.text when not subscribed
@@ -0,0 +1,42 @@
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # No fcntl (Windows), where the server never forks workers
+    fcntl = None
+
+class ProcessLock():
+    """
+    Exclusive lock shared between processes, held with flock on filename. It is not re-entrant and
+    does not exclude threads of the same process; pair it with a threading lock.
+
+    The lock file is opened lazily and reopened after a fork, because flock locks belong to the
+    open file, which a forked child would otherwise share with its parent.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.fd = None
+        self.pid = None
+
+    def acquire(self):
+        if fcntl is None: return
+        if self.fd is not None and self.pid != os.getpid():
+            os.close(self.fd)
+            self.fd = None
+        if self.fd is None:
+            self.fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+            self.pid = os.getpid()
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def release(self):
+        if fcntl is None or self.fd is None: return
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,78 @@
+from random import Random
+
+class QuizPool():
+    """
+    The words selected for a quiz. Items are (key, text) pairs, where text is the word presented to
+    the user and key is the vocab entry it came from. Items live in an array with a position map,
+    so draw and remove are O(1) (removal swaps the last item into the hole).
+
+    With without_replacement set, items[:remaining] are the items not yet drawn in the current
+    round; a drawn item is swapped behind that boundary, and a new round starts once all have been
+    drawn. Pass a seed for a reproducible sequence of draws.
+    """
+
+    def __init__(self, seed=None, without_replacement=False):
+        self.random = Random(seed)
+        self.without_replacement = without_replacement
+        self.items = []
+        self.positions = {}
+        self.by_key = {}
+        self.remaining = 0
+
+    def seed(self, seed):
+        self.random.seed(seed)
+
+    def fill(self, items):
+        self.items = list(dict.fromkeys(items))
+        self.positions = {item: i for i, item in enumerate(self.items)}
+        self.by_key = {}
+        for item in self.items:
+            self.by_key.setdefault(item[0], {})[item] = None
+        self.remaining = len(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def draw(self):
+        if not self.items:
+            return None
+        if not self.without_replacement:
+            return self.items[self.random.randrange(len(self.items))]
+        if self.remaining == 0:
+            self.remaining = len(self.items)
+        idx = self.random.randrange(self.remaining)
+        self.remaining -= 1
+        self._swap(idx, self.remaining)
+        return self.items[self.remaining]
+
+    def remove(self, item):
+        pos = self.positions.get(item, None)
+        if pos is None:
+            return False
+        if pos < self.remaining:
+            # Keep the not-yet-drawn region contiguous
+            self.remaining -= 1
+            self._swap(pos, self.remaining)
+            pos = self.remaining
+        self._swap(pos, len(self.items) - 1)
+        self.items.pop()
+        del self.positions[item]
+        keys = self.by_key[item[0]]
+        del keys[item]
+        if not keys: del self.by_key[item[0]]
+        return True
+
+    # Remove every item drawn from the given vocab entry
+    def remove_key(self, key):
+        for item in list(self.by_key.get(key, ())):
+            self.remove(item)
+
+    def _swap(self, i, j):
+        if i == j: return
+        items = self.items
+        items[i], items[j] = items[j], items[i]
+        self.positions[items[i]] = i
+        self.positions[items[j]] = j
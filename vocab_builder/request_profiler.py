@@ -0,0 +1,133 @@
+import os
+import time
+import logging
+import threading
+from fnmatch import fnmatch
+
+# Profile the next VB_PROFILE_REQUESTS requests at startup, optionally only those whose route
+# matches VB_PROFILE_ROUTE, a glob such as /vocab/* or a comma separated list of them
+PROFILE_REQUESTS = int(os.environ.get("VB_PROFILE_REQUESTS", 0))
+PROFILE_ROUTE = os.environ.get("VB_PROFILE_ROUTE", None)
+# Deepest stack written to a collapsed stack file
+MAX_STACK_DEPTH = 64
+# Call paths contributing less than this many seconds are left out of collapsed stacks
+MIN_STACK_SECONDS = 1e-6
+
+class RequestProfiler():
+    """
+    Profiles selected requests with cProfile. Once armed with start(), the next count requests
+    whose route matches one of the route globs are profiled; with no count, every matching request
+    is profiled until stop(). Each profile is written to directory as <name>.prof, readable with
+    pstats or snakeviz, and <name>.collapsed, a collapsed stack file for flamegraph.pl or
+    speedscope.
+
+    One request is profiled at a time: requests that arrive while another is being profiled run
+    unprofiled and don't use up the count, though on the gevent server whatever they run while the
+    profiled request waits on I/O shows up in its profile. While disarmed, begin() is a single
+    attribute check.
+    """
+
+    def __init__(self, directory, count=PROFILE_REQUESTS, routes=PROFILE_ROUTE):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.armed = False
+        self.active = None
+        self.remaining = None
+        self.routes = None
+        self.written = []
+        self.sequence = 0
+        if count or routes:
+            self.start(count or None, routes)
+
+    # Profile the next count requests matching routes, a glob or list of globs. None for either
+    # means no limit.
+    def start(self, count=None, routes=None):
+        if isinstance(routes, str): routes = [r.strip() for r in routes.split(",") if r.strip()]
+        with self.lock:
+            self.remaining = count
+            self.routes = routes or None
+            self.armed = count is None or count > 0
+        logging.info(f"Profiling {count if count else 'all'} requests to {', '.join(routes) if routes else 'any route'}")
+
+    def stop(self):
+        with self.lock:
+            self.armed = False
+            self.remaining = None
+            self.routes = None
+
+    def status(self):
+        return {"armed": self.armed, "remaining": self.remaining, "routes": self.routes,
+                "directory": self.directory, "profiles": self.written[-20:]}
+
+    def matches(self, route):
+        return self.routes is None or any(fnmatch(route, r) for r in self.routes)
+
+    # Start profiling the current request if it is selected. Returns the profile, or None.
+    def begin(self, route):
+        if not self.armed: return None
+        with self.lock:
+            if not self.armed or self.active is not None or not self.matches(route): return None
+            if self.remaining is not None:
+                self.remaining -= 1
+                if self.remaining <= 0: self.armed = False
+            import cProfile
+            self.active = profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    # Stop profiling and write the profile files. Returns the path of the .prof file.
+    def end(self, profile, route):
+        profile.disable()
+        try:
+            with self.lock:
+                self.sequence += 1
+                sequence = self.sequence
+            slug = route.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "root"
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{sequence}-{slug}"
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{name}.prof")
+            import pstats
+            stats = pstats.Stats(profile)
+            stats.dump_stats(path)
+            with open(os.path.join(self.directory, f"{name}.collapsed"), 'w') as f:
+                for stack, micros in collapsed_stacks(stats):
+                    f.write(f"{stack} {micros}\n")
+            self.written.append(os.path.basename(path))
+            logging.info(f"Wrote profile of {route} to {path}")
+            return path
+        finally:
+            with self.lock:
+                self.active = None
+
+def frame_name(func):
+    filename, line, name = func
+    if filename == "~": return name
+    return f"{os.path.basename(filename)}:{name}:{line}"
+
+# (stack, microseconds) pairs in the collapsed stack format, derived from the profile's call graph.
+# cProfile keeps caller->callee times rather than whole stacks, so a function's time is split
+# between its stacks in proportion to the time each of its callers spent in it.
+def collapsed_stacks(stats):
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, value in stats.stats.items() if not value[4]]
+    totals = {}
+
+    def walk(func, stack, share):
+        tt, ct = stats.stats[func][2], stats.stats[func][3]
+        stack = stack + [frame_name(func)]
+        fraction = share / ct if ct else 0
+        if tt * fraction > 0:
+            key = ";".join(stack)
+            totals[key] = totals.get(key, 0) + tt * fraction
+        if len(stack) >= MAX_STACK_DEPTH: return
+        for callee, edge_ct in callees.get(func, ()):
+            # Recursion is folded into the first frame of the function
+            if edge_ct * fraction < MIN_STACK_SECONDS or frame_name(callee) in stack: continue
+            walk(callee, stack, edge_ct * fraction)
+
+    for root in roots:
+        walk(root, [], stats.stats[root][3])
+    return [(stack, max(1, round(seconds * 1e6))) for stack, seconds in sorted(totals.items())]
@@ -0,0 +1,18 @@
+class ResponseCache():
+    """
+    Serialized response bodies, one per name, tagged with the version of the data they were built
+    from. A body is rebuilt only when it is requested with a different version.
+    """
+
+    def __init__(self, serialize):
+        self.serialize = serialize
+        self.entries = {}
+
+    # Returns (etag, body) for the current version, calling build() for the data if needed
+    def get(self, name, version, build):
+        entry = self.entries.get(name, None)
+        if entry is None or entry[0] != version:
+            body = self.serialize(build()).encode('utf-8')
+            entry = (version, body)
+            self.entries[name] = entry
+        return str(version), entry[1]
@@ -1,39 +1,288 @@
 #!/usr/bin/env python3
-from flask import Flask, jsonify, request, after_this_request
-from gevent.pywsgi import WSGIServer
-from vocab_builder import VocabBuilder
+from flask import Flask, Response, jsonify, request, after_this_request, send_file, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.local import LocalProxy
+from gevent.pywsgi import WSGIServer, LoggingLogAdapter
+import gevent
+import log_config
+from vocab_builder import VocabBuilder, DATA_DIR, LOGGING_DIR
+from vocab_entry import Entry
+from response_cache import ResponseCache
+from metrics import metrics
+from request_profiler import RequestProfiler
+from sessions import SessionManager, SavedSessions, DEFAULT_SESSION
 import os, signal
+import logging
+from os.path import basename
 import socket
+import time
+import threading
+from datetime import date
 
 DEFAULT_LISTEN_PORT = 5023
 
 #We use the prefix VITE_ so the frontend and backend can
 #be set from a single value.
 port = os.environ.get("VITE_SERVER_PORT", DEFAULT_LISTEN_PORT)
+# Worker processes forked to serve requests on the shared port. Needs os.fork, so always 1 on Windows.
+WORKERS = int(os.environ.get("VB_WORKERS", 1)) if hasattr(os, "fork") else 1
+
+class VocabJSONProvider(DefaultJSONProvider):
+    # Vocab entries are held as Entry records; send them in the vocab file schema
+    @staticmethod
+    def default(o):
+        if isinstance(o, Entry): return o.to_dict()
+        return DefaultJSONProvider.default(o)
 
 api = Flask(__name__)
-http_server = WSGIServer(('', int(port)), api)
-app = VocabBuilder()
+api.json = VocabJSONProvider(api)
+# The WSGI server's access and error logs go through logging, and its queue, rather than
+# straight to stderr. VB_ACCESS_LOG=off drops the access log.
+ACCESS_LOG = None if os.environ.get("VB_ACCESS_LOG", "on").lower() in ("off", "0", "false") else \
+  LoggingLogAdapter(logging.getLogger("access"), logging.INFO)
+ERROR_LOG = LoggingLogAdapter(logging.getLogger("wsgi"), logging.ERROR)
+shared = VocabBuilder()
+# With several workers, a learner's requests can land on any of them, so session settings are
+# saved and a worker sets a session up again whenever they were saved by another worker.
+saved_sessions = SavedSessions(os.path.join(DATA_DIR, "sessions")) if WORKERS > 1 else None
+
+def restore_session(token, app):
+    stamp = saved_sessions.stamp(token)
+    if stamp is None or stamp == getattr(app, 'saved_stamp', None): return
+    settings = saved_sessions.load(token)
+    app.saved_stamp = stamp
+    app.answered_offset = 0
+    if settings is None: return
+    try:
+        app.initialize(**settings)
+        app.select_words()
+    except Exception as exc:
+        api.logger.error(f"Unable to restore session {token[:8]}: {exc}")
+
+# Drop the words answered on other workers this round from the session's quiz pool
+def sync_answered(token, app):
+    keys, app.answered_offset = saved_sessions.answered(token, getattr(app, 'answered_offset', 0))
+    for key in keys:
+        app.pool.remove_key(key)
+
+# Saves the new round's settings, stamped so this worker doesn't set the session up again
+def start_round(app, settings=None, **changes):
+    if saved_sessions:
+        app.saved_stamp = saved_sessions.start_round(session_token(), settings, **changes)
+        app.answered_offset = 0
+
+def make_session():
+    session = VocabBuilder(client=shared.client, catalog=shared.catalog)
+    if saved_sessions:
+        session.on_answered = lambda keys: saved_sessions.add_answered(session_token(), keys)
+    return session
+
+sessions = SessionManager(make_session)
+# Clients pick a session with the X-VB-Session header or the session query parameter. Requests
+# without one share the default session.
+SESSION_HEADER = "X-VB-Session"
+
+def session_token():
+    return request.headers.get(SESSION_HEADER, None) or request.args.get('session', None) or DEFAULT_SESSION
+
+# The requesting session's VocabBuilder, or the default session's outside of a request
+def current_app():
+    if not has_request_context():
+        return sessions.get(DEFAULT_SESSION)
+    if 'app' not in g:
+        g.app = sessions.get(session_token())
+    return g.app
+
+app = LocalProxy(current_app)
+responses = ResponseCache(api.json.dumps)
+# Profiles selected requests into LOGGING_DIR/profiles, when armed by VB_PROFILE_REQUESTS,
+# VB_PROFILE_ROUTE or /profile/start
+profiler = RequestProfiler(os.path.join(LOGGING_DIR, "profiles"))
 
 def is_port_in_use(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(('0.0.0.0', port)) == 0
 
+# Pid of the process supervising the workers, when this process is a worker
+supervisor = None
+
 def shutdown_server():
     api.logger.info('Shutting down server...')
-    os.kill(os.getpid(), signal.SIGINT)
+    if supervisor is not None:
+        # The supervisor stops every worker, this one included
+        os.kill(supervisor, signal.SIGTERM)
+    else:
+        os.kill(os.getpid(), signal.SIGINT)
 
 def start_server():
     if is_port_in_use(int(port)):
       api.logger.error(f"Port {port} is in use by abnother program. " +
         "Either identify and stop that program, or start the server with a different port.")
+    elif WORKERS > 1:
+      api.logger.info(f"Starting {WORKERS} workers on port {port}")
+      serve_workers(WORKERS)
     else:
       api.logger.info(f"Starting server on port {port}")
       try:
+        http_server = WSGIServer(('', int(port)), api, log=ACCESS_LOG, error_log=ERROR_LOG)
+        # Listen first, so /alive answers while the data files and language catalog are set up
+        http_server.start()
+        start_bootstrap()
         http_server.serve_forever()
       except Exception as e:
         api.logger.error(e)
 
+# Run shared.bootstrap() on a background thread. Requests that need its results wait for the
+# parts they use.
+def start_bootstrap():
+    def run():
+        try:
+            shared.bootstrap()
+            api.logger.info("Data files and language catalog ready")
+        except Exception as e:
+            api.logger.error(f"Startup setup failed: {e}")
+    threading.Thread(target=run, name="bootstrap", daemon=True).start()
+
+# Pre-fork mode: bind the port once, then fork workers that all accept on it. The parent only
+# supervises, restarting workers that die, until it gets SIGINT or SIGTERM (e.g. from /kill).
+def serve_workers(count):
+    saved_sessions.clear()
+    listener = WSGIServer.get_listener(('', int(port)), backlog=128, family=socket.AF_INET)
+    # Before forking, so workers don't copy the same files at once. Connections wait in the
+    # listen backlog meanwhile.
+    shared.ensure_data_files()
+    workers = set()
+    stopping = []
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(listener)
+            log_config.stop()
+            os._exit(0)
+        workers.add(pid)
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(count):
+        spawn()
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            api.logger.error(f"Worker {pid} exited with status {status}, restarting it")
+            # Don't spin if workers die at startup
+            time.sleep(1)
+            spawn()
+    api.logger.info("All workers stopped")
+
+def run_worker(listener):
+    global supervisor
+    gevent.reinit()
+    supervisor = os.getppid()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    gevent.signal_handler(signal.SIGTERM, stop_worker)
+    api.logger.info(f"Worker {os.getpid()} started")
+    try:
+        http_server = WSGIServer(listener, api, log=ACCESS_LOG, error_log=ERROR_LOG)
+        http_server.start()
+        start_bootstrap()
+        http_server.serve_forever()
+    except Exception as e:
+        api.logger.error(e)
+
+# Write out queued log records before exiting
+def stop_worker():
+    log_config.stop()
+    os._exit(0)
+
+# Per-route request latency and errors. Registered first, so the time spent in the other
+# request hooks is included.
+@api.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+# The route pattern rather than the path, so the number of metric series stays bounded
+def request_route():
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+@api.before_request
+def start_profile():
+    if profiler.armed:
+        g.profile = profiler.begin(request_route())
+
+@api.after_request
+def end_profile(resp):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        resp.headers["X-VB-Profile"] = profiler.end(profile, request_route())
+        resp.headers["Access-Control-Expose-Headers"] = ", ".join(
+            h for h in (resp.headers.get("Access-Control-Expose-Headers", None), "X-VB-Profile") if h)
+    return resp
+
+# The session header makes browsers send a preflight even for GET routes, and Flask answers
+# OPTIONS itself for routes that don't list it, without running the view's header hooks
+@api.after_request
+def allow_preflight(resp):
+    if request.method == "OPTIONS":
+        resp.headers.setdefault("Access-Control-Allow-Origin", "*")
+        resp.headers.setdefault("Access-Control-Allow-Headers", f"Content-Type, {SESSION_HEADER}")
+    return resp
+
+@api.after_request
+def check_request_status(resp):
+    if resp.status_code >= 400: g.request_error = True
+    return resp
+
+@api.teardown_request
+def record_request(exc):
+    # A request that raised skipped end_profile
+    profile = g.pop('profile', None)
+    if profile is not None: profiler.end(profile, request_route())
+    start = g.pop('request_start', None)
+    if start is None: return
+    route = request_route()
+    metrics.observe("vb_request_seconds", time.perf_counter() - start, route=route, method=request.method)
+    if exc is not None or g.get('request_error', False):
+        metrics.add("vb_request_errors_total", route=route, method=request.method)
+
+# Workers share the data files: pick up other workers' writes before handling a request
+@api.before_request
+def sync_worker_data():
+    if WORKERS > 1:
+        restore_session(session_token(), app)
+        if app.initialized:
+            app.store.refresh()
+            sync_answered(session_token(), app)
+
+# JSON response served from the response cache, with an ETag for the data version. Answers
+# If-None-Match with 304 when the data is unchanged, without building the body. A name of None
+# builds the body on every request instead of caching it.
+def cached_json(name, version, build):
+    if request.if_none_match.contains(str(version)):
+        etag, body = str(version), b""
+    elif name is None:
+        etag, body = str(version), api.json.dumps(build()).encode('utf-8')
+    else:
+        etag, body = responses.get(name, version, build)
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Access-Control-Expose-Headers"] = "ETag"
+    return resp.make_conditional(request)
+
 class NotInitializedException(Exception):
     def __init__(self):
       self.code = 400
@@ -47,6 +296,7 @@ class BadRequestException(Exception):
 @api.errorhandler(NotInitializedException)
 @api.errorhandler(BadRequestException)
 def error_handler(err):
+    g.request_error = True
     api.logger.error(err.msg)
     return jsonify({"Error": err.msg}), 200
 
@@ -65,8 +315,15 @@ def init():
         return resp
     # if not lang1 or not lang2: return jsonify({"Result": "No language info provided"})
 
+    # Optional quiz settings: a seed for reproducible draws, and drawing each word once per round
+    quiz_args = {}
+    if 'seed' in request.args:
+        quiz_args['seed'] = request.args['seed']
+    if 'without_replacement' in request.args:
+        quiz_args['without_replacement'] = request.args['without_replacement'].lower() == 'true'
+
     try:
-        app.initialize(no_trans_check = False,
+        settings = dict(no_trans_check = False,
           no_word_lookup = False,
           min_correct = int(request.args['min_correct']) or 5,
           min_age = int(request.args['min_age']),
@@ -74,12 +331,106 @@ def init():
           word_order= "from-to",
           from_lang = lang1,
           to_lang = lang2,
-          cli_launch = False)
+          cli_launch = False,
+          **quiz_args)
+        app.initialize(**settings)
     except Exception as exc:
         api.logger.error(f"Init exception {exc}")
         raise BadRequestException(exc.args[0])
+    start_round(app, settings)
+    
+    return jsonify({"Result": "Initialized", "Session": session_token()}), 200
+
+@api.route('/session/new', methods=['GET'])
+def new_session():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        return resp
+    
+    token = sessions.new_token()
+    sessions.get(token)
+    return jsonify({"Session": token}), 200
+
+@api.route('/session/end', methods=['POST', 'OPTIONS', 'GET'])
+def end_session():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
+        return resp
+    
+    if request.method == "OPTIONS" or request.method == 'GET':
+        return "OK", 200
+    
+    if saved_sessions:
+        saved_sessions.remove(session_token())
+    return jsonify({"Result": sessions.end(session_token())}), 200
+
+@api.route('/session/stats', methods=['GET'])
+def session_stats():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        return resp
     
-    return jsonify({"Result": "Initialized"}), 200
+    return jsonify(sessions.stats()), 200
+
+# Request and operation metrics in the Prometheus text format, or as JSON with ?format=json
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    if request.args.get('format', None) == 'json':
+        resp = jsonify(metrics.as_dict())
+    else:
+        resp = Response(metrics.prometheus(), mimetype="text/plain; version=0.0.4")
+    resp.headers["Access-Control-Allow-Origin"] = "*"
+    return resp
+
+# Profile the next "requests" requests, and/or those whose route matches the "route" glob(s).
+# Responses to profiled requests carry the profile's path in an X-VB-Profile header.
+@api.route('/profile/start', methods=['POST', 'OPTIONS', 'GET'])
+def start_profiling():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
+        return resp
+
+    if request.method == "OPTIONS" or request.method == 'GET':
+        return "OK", 200
+
+    body = request.get_json(force=True, silent=True) or {}
+    try:
+        count = int(body['requests']) if body.get('requests', None) is not None else None
+    except (TypeError, ValueError):
+        raise BadRequestException(f"Invalid requests: {body['requests']}")
+    if count is None and not body.get('route', None):
+        raise BadRequestException("Expected requests, route or both")
+    profiler.start(count, body.get('route', None))
+    return jsonify(profiler.status()), 200
+
+@api.route('/profile/stop', methods=['POST', 'OPTIONS', 'GET'])
+def stop_profiling():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
+        return resp
+
+    if request.method == "OPTIONS" or request.method == 'GET':
+        return "OK", 200
+
+    profiler.stop()
+    return jsonify(profiler.status()), 200
+
+@api.route('/profile/status', methods=['GET'])
+def profiling_status():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        return resp
+
+    return jsonify(profiler.status()), 200
 
 @api.route('/kill', methods=['POST', 'OPTIONS', 'GET'])
 def kill():
@@ -99,7 +450,7 @@ def is_alive():
   @after_this_request
   def add_header(resp):
       resp.headers["Access-Control-Allow-Origin"] = "*"
-      resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+      resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
       return resp
   
   return jsonify({"status": "OK"}), 200
@@ -111,7 +462,7 @@ def set_api_lookup():
   @after_this_request
   def add_header(resp):
       resp.headers["Access-Control-Allow-Origin"] = "*"
-      resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+      resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
       return resp
   
   if request.method == "OPTIONS" or request.method == 'GET':
@@ -144,7 +495,7 @@ def set_api_key():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
     
     if request.method == "OPTIONS" or request.method == 'GET':
@@ -187,9 +538,14 @@ def get_languages():
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
         return resp
-    
-    langs = app.get_avail_langs()
-    return jsonify(langs)
+
+    # Until a catalog has been loaded or fetched, look it up on every request and send an empty
+    # result uncached, so a failed first fetch is retried rather than served from then on
+    if not app.catalog.langs:
+        langs = app.get_avail_langs()
+        if not langs:
+            return jsonify(langs), 200
+    return cached_json("languages", app.data_version("languages"), app.get_avail_langs)
     
 @api.route('/vocab/get_all', methods=['GET'])
 def get_vocab():
@@ -201,8 +557,40 @@ def get_vocab():
     
     if not app.initialized:
         raise NotInitializedException
-    vocab = app.get_vocab()
-    return jsonify(vocab), 200
+    if not any(param in request.args for param in VOCAB_QUERY_PARAMS):
+        return cached_json(f"vocab:{app.vocab_filename_json}", app.data_version("vocab"), app.get_vocab)
+    try:
+        query = parse_vocab_query(request.args)
+        version = app.data_version("vocab")
+        # Due status also depends on the day and on min_age, which defaults to the session's
+        if "due" in query:
+            version = f"{version}-{date.today().toordinal() - query.get('min_age', app.min_age)}"
+        return cached_json(None, version, lambda: app.query_vocab(**query))
+    except ValueError as exc:
+        raise BadRequestException(msg = str(exc))
+
+VOCAB_QUERY_PARAMS = ("limit", "cursor", "sort", "order", "part_of_speech", "due", "min_age",
+                      "min_count", "max_count", "contains", "fields")
+
+# Arguments for VocabBuilder.query_vocab from /vocab/get_all query parameters. Raises ValueError
+# for malformed values.
+def parse_vocab_query(args):
+    query = {}
+    if 'limit' in args: query['limit'] = int(args['limit'])
+    if 'cursor' in args: query['cursor'] = args['cursor']
+    if 'sort' in args: query['sort'] = args['sort']
+    if 'order' in args:
+        if args['order'] not in ('asc', 'desc'):
+            raise ValueError(f"Invalid order {args['order']}. Expected asc or desc")
+        query['descending'] = args['order'] == 'desc'
+    if 'part_of_speech' in args: query['part'] = args['part_of_speech']
+    if 'due' in args: query['due'] = args['due'].lower() == 'true'
+    if 'min_age' in args: query['min_age'] = int(args['min_age'])
+    if 'min_count' in args: query['min_count'] = int(args['min_count'])
+    if 'max_count' in args: query['max_count'] = int(args['max_count'])
+    if 'contains' in args: query['contains'] = args['contains']
+    if 'fields' in args: query['fields'] = [f for f in args['fields'].split(',') if f]
+    return query
 
 @api.route('/languages/get_defaults', methods=['GET'])
 def get_default_langs():
@@ -214,8 +602,7 @@ def get_default_langs():
     
     if not app.initialized:
         raise NotInitializedException
-    default_langs = app.get_default_langs()
-    return jsonify(default_langs), 200
+    return cached_json("default_langs", app.data_version("default_langs"), app.get_default_langs)
 
 @api.route('/partsofspeech/get', methods=['GET'])
 def get_parts_of_speech():
@@ -226,15 +613,14 @@ def get_parts_of_speech():
         resp.headers["Access-Control-Allow-Origin"] = "*"
         return resp
     
-    parts = app.get_parts_of_speech()
-    return jsonify(parts)
+    return cached_json("parts_of_speech", app.data_version("parts_of_speech"), app.get_parts_of_speech)
 
 @api.route('/partsofspeech/set', methods=['POST', 'OPTIONS', 'GET'])
 def set_parts_of_speech():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
     
     if request.method == "OPTIONS" or request.method == 'GET':
@@ -277,6 +663,44 @@ def translate():
     res = app.translate(word, from_lang, to_lang)
     return jsonify({"result": res}), 200
 
+@api.route('/vocab/translate_many', methods=['POST', 'OPTIONS', 'GET'])
+def translate_many():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
+        return resp
+    
+    if request.method == "OPTIONS" or request.method == 'GET':
+        return "OK", 200
+    
+    global app
+    try:
+        body = request.get_json(force=True)
+    except BadRequestException as exc:
+        raise exc
+    
+    if not app.initialized:
+        raise NotInitializedException
+    
+    for param in ('words', 'from_lang', 'to_lang'):
+        if param not in body:
+            raise BadRequestException(msg = f"Missing {param} parameter")
+    
+    res = app.translate_many(body['words'], body['from_lang'], body['to_lang'])
+    return jsonify({"result": res}), 200
+
+@api.route('/translation_cache/stats', methods=['GET'])
+def translation_cache_stats():
+    global app
+    
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        return resp
+    
+    return jsonify(app.get_translation_cache_stats()), 200
+
 @api.route('/vocab/select_words', methods=['GET'])
 def select_words():
     global app
@@ -290,7 +714,9 @@ def select_words():
         raise NotInitializedException
     
     count = app.select_words()
-    api.logger.debug(f"{count} WORDS SELECTED")
+    start_round(app)
+    sessions.evict(keep=session_token())
+    api.logger.debug("%d WORDS SELECTED", count)
     return jsonify({"Result": count}), 200
 
 @api.route('/vocab/next_word', methods=['GET'])
@@ -314,7 +740,7 @@ def delete_vocab_entry():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
     
     if request.method == "OPTIONS" or request.method == 'GET':
@@ -329,23 +755,91 @@ def delete_vocab_entry():
     if not app.initialized:
         raise NotInitializedException
     
-    deleted = []
-    try:
-        if not isinstance(entry, list):
-            entry = [entry]
-        for item in entry:
-            app.delete_entry(item['key'])
-            deleted.append(item['key'])
-    except Exception as e:
-        return jsonify({"error": str(e)}),400
-    return jsonify({"deleted": deleted}), 200
+    if not isinstance(entry, list):
+        entry = [entry]
+    results = apply_batch(entry, lambda item: {"key": item['key'], "deleted": app.delete_entry(item['key'])})
+    deleted = [r["key"] for r in results if r.get("deleted", False)]
+    return jsonify({"deleted": deleted, "results": results}), 200
+
+# Apply fn to each item of a batch request, saving the vocab once at the end. Returns the
+# per-item results, with {"error": ...} for the items that failed.
+def apply_batch(items, fn):
+    results = []
+    with app.batch():
+        for item in items:
+            try:
+                results.append(fn(item))
+            except Exception as e:
+                results.append({"error": f"{type(e).__name__}: {e}"})
+    return results
+
+def parse_batch(request):
+    items = request.get_json(force=True)
+    if not isinstance(items, list):
+        raise BadRequestException(msg = "Expected a JSON array")
+    return items
+
+def merge_entry(word_entry, update):
+    app.merge_vocab([(word_entry['from'], word_entry['to'], word_entry['part_of_speech'])], force=True, update=update)
+    return {"to": word_entry['to'], "result": "OK"}
+
+@api.route('/vocab/add_entries', methods=['POST', 'OPTIONS', 'GET'])
+def add_vocab_entries():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
+        return resp
+    
+    if request.method == "OPTIONS" or request.method == 'GET':
+        return "OK", 200
+    
+    if not app.initialized:
+        raise NotInitializedException
+    
+    results = apply_batch(parse_batch(request), lambda item: merge_entry(item, update=False))
+    return jsonify({"results": results}), 200
+
+@api.route('/vocab/update_entries', methods=['POST', 'OPTIONS', 'GET'])
+def update_vocab_entries():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
+        return resp
+    
+    if request.method == "OPTIONS" or request.method == 'GET':
+        return "OK", 200
+    
+    if not app.initialized:
+        raise NotInitializedException
+    
+    results = apply_batch(parse_batch(request), lambda item: merge_entry(item, update=True))
+    return jsonify({"results": results}), 200
+
+@api.route('/vocab/mark_correct_many', methods=['POST', 'OPTIONS', 'GET'])
+def vocab_mark_correct_many():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
+        return resp
+    
+    if request.method == "OPTIONS" or request.method == 'GET':
+        return "OK", 200
+    
+    if not app.initialized:
+        raise NotInitializedException
+    
+    results = apply_batch(parse_batch(request), lambda item: {"text": item['text'], "marked": app.mark_correct(item['text'])})
+    return jsonify({"results": results}), 200
 
 @api.route('/vocab/add_entry', methods=['POST', 'OPTIONS', 'GET'])
 def add_vocab_entry():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
     
     if request.method == "OPTIONS" or request.method == 'GET':
@@ -370,7 +864,7 @@ def update_vocab_entry():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
     
     if request.method == "OPTIONS" or request.method == 'GET':
@@ -396,7 +890,7 @@ def vocab_mark_correct():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
     
     if request.method == "OPTIONS" or request.method == 'GET':
@@ -413,7 +907,7 @@ def vocab_mark_correct():
         raise NotInitializedException
     
     app.mark_correct(entry['text'])
-    print(f"{entry['text']} is correct")
+    api.logger.debug("%s is correct", entry['text'])
     return jsonify({}),200
     #TODO remove word from selection in app.mark_correct (and no longer in app.run_test_vocab) But look
     #at word-order when removing, to know which language the removed word is given in. DONE??
@@ -423,7 +917,7 @@ def set_default_langs():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
     
     if request.method == "OPTIONS" or request.method == 'GET':
@@ -448,7 +942,7 @@ def set_word_order():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
     
     if request.method == "OPTIONS" or request.method == 'GET':
@@ -466,6 +960,7 @@ def set_word_order():
     
     app.word_order = word_order['value']
     app.select_words()
+    start_round(app, word_order=word_order['value'])
     
     return jsonify({}),200
 
@@ -474,7 +969,7 @@ def import_csv():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
     
     if request.method == "OPTIONS" or request.method == 'GET':
@@ -484,22 +979,39 @@ def import_csv():
     if not app.initialized:
         raise NotInitializedException
     
+    summary = None
     if request.method == 'POST':
         if 'file' not in request.files:
-          print('Import CSV vocab: No file found in request')
+          api.logger.error('Import CSV vocab: No file found in request')
         file = request.files['file']
         if file.filename == '':
-            print('Import CSV vocab: No file name specified')
+            api.logger.error('Import CSV vocab: No file name specified')
         if file:
-            app.import_vocab_csv(file=file.read())
-    return jsonify({"Result": "OK"}),200
+            # Werkzeug spools large uploads to a temp file. Stream from it, and yield to other
+            # greenlets between chunks so /vocab/import_progress can be polled.
+            summary = app.import_vocab_csv(file=file.stream, on_progress=lambda summary: gevent.sleep(0))
+    return jsonify({"Result": "OK", "Summary": summary}),200
+
+@api.route('/vocab/import_progress', methods=['GET'])
+def import_progress():
+    global app
+    
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        return resp
+    
+    if not app.initialized:
+        raise NotInitializedException
+    
+    return jsonify(app.import_progress), 200
 
 @api.route('/vocab/export_csv', methods=['GET'])
 def export_csv():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
 
     global app
@@ -509,12 +1021,53 @@ def export_csv():
     data = app.export_vocab_csv()
     return jsonify({"file": data}),200
 
+EXPORT_MIMETYPES = {"json": "application/json", "csv": "text/csv"}
+
+# Stream an export file. Handles If-None-Match/If-Modified-Since (304) and Range (206), and
+# sends a pre-compressed copy to clients that accept gzip when no range was requested.
+def send_export(fmt):
+    gzipped = request.accept_encodings['gzip'] > 0 and 'Range' not in request.headers
+    path, etag = app.export_vocab_file(fmt, compressed=gzipped)
+    resp = send_file(path, mimetype=EXPORT_MIMETYPES[fmt], as_attachment=True,
+                     download_name=basename(path[:-3] if gzipped else path), etag=etag, conditional=True)
+    if gzipped:
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Access-Control-Expose-Headers"] = "ETag, Content-Disposition"
+    return resp
+
+@api.route('/vocab/download_csv', methods=['GET'])
+def download_csv():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        return resp
+
+    global app
+    if not app.initialized:
+        raise NotInitializedException
+    
+    return send_export("csv")
+
+@api.route('/vocab/download_json', methods=['GET'])
+def download_json():
+    @after_this_request
+    def add_header(resp):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        return resp
+
+    global app
+    if not app.initialized:
+        raise NotInitializedException
+    
+    return send_export("json")
+
 @api.route('/vocab/import_json', methods=['GET', 'OPTIONS', 'POST'])
 def import_json():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
     
     if request.method == "OPTIONS" or request.method == 'GET':
@@ -526,10 +1079,10 @@ def import_json():
     
     if request.method == 'POST':
         if 'file' not in request.files:
-          print('Import JSON vocab: No file found in request')
+          api.logger.error('Import JSON vocab: No file found in request')
         file = request.files['file']
         if file.filename == '':
-            print('Import JSON vocabn: No file name specified')
+            api.logger.error('Import JSON vocab: No file name specified')
         if file:
             app.import_vocab_json(file=file)
     return jsonify({"Result": "OK"}),200
@@ -539,7 +1092,7 @@ def export_json():
     @after_this_request
     def add_header(resp):
         resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Headers"] = f"Content-Type, {SESSION_HEADER}"
         return resp
 
     global app
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+from collections import OrderedDict
+
+from atomic_write import atomic_write
+
+# Most sessions kept at once. The least recently used ones are evicted past this.
+MAX_SESSIONS = int(os.environ.get("VB_MAX_SESSIONS", 256))
+# Seconds a session may sit idle before it is evicted. 0 keeps idle sessions until evicted by the caps.
+IDLE_TIMEOUT = float(os.environ.get("VB_SESSION_IDLE_TIMEOUT", 4 * 3600))
+# Cap on the estimated memory held by all sessions' quiz pools, in MB
+MAX_POOL_MB = float(os.environ.get("VB_SESSION_MAX_POOL_MB", 256))
+# Rough size of one quiz pool item: its tuple plus its entries in the pool's position and key maps
+POOL_ITEM_BYTES = 300
+
+DEFAULT_SESSION = "default"
+
+class SessionManager():
+    """
+    One VocabBuilder per learner session, keyed by session token, each with its own quiz pool,
+    settings and language pair. Vocabularies are shared through the store registry, and the
+    translator client and language catalog are shared by every session.
+
+    Sessions are kept in least recently used order. Sessions idle for longer than idle_timeout,
+    and the least recently used ones past max_sessions or past max_pool_mb of estimated quiz pool
+    memory, are evicted. An evicted session's token starts over as a new, uninitialized session.
+    The default session, shared by clients that send no token, is never evicted, since they have
+    no way to start a session over.
+    """
+
+    def __init__(self, factory, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT, max_pool_mb=MAX_POOL_MB):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_pool_bytes = max_pool_mb * 1024 * 1024
+        # token -> [VocabBuilder, last used (monotonic secs)]
+        self.sessions = OrderedDict()
+        self.evictions = 0
+
+    def new_token(self):
+        return uuid.uuid4().hex
+
+    # The session for token, created if it doesn't exist
+    def get(self, token=DEFAULT_SESSION):
+        now = time.monotonic()
+        session = self.sessions.get(token, None)
+        if session is None:
+            session = [self.factory(), now]
+            self.sessions[token] = session
+            self.evict(now, keep=token)
+        else:
+            session[1] = now
+            self.sessions.move_to_end(token)
+        return session[0]
+
+    def end(self, token):
+        return self.sessions.pop(token, None) is not None
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, token):
+        return token in self.sessions
+
+    def pool_bytes(self):
+        return sum(len(app.pool) for app, _ in self.sessions.values()) * POOL_ITEM_BYTES
+
+    def evict(self, now=None, keep=None):
+        now = time.monotonic() if now is None else now
+        if self.idle_timeout:
+            # Least recently used first, so stop at the first session that is still fresh
+            for token, (_, last_used) in list(self.sessions.items()):
+                if now - last_used <= self.idle_timeout: break
+                if self.evictable(token, keep): self._evict(token, "idle")
+        while len(self.sessions) > self.max_sessions:
+            if not self._evict_oldest(keep, "session cap"): break
+        if self.max_pool_bytes:
+            pool_bytes = self.pool_bytes()
+            while pool_bytes > self.max_pool_bytes:
+                app = self._evict_oldest(keep, "memory cap")
+                if not app: break
+                pool_bytes -= len(app.pool) * POOL_ITEM_BYTES
+
+    def evictable(self, token, keep):
+        return token != keep and token != DEFAULT_SESSION
+
+    def _evict_oldest(self, keep, reason):
+        for token in self.sessions:
+            if self.evictable(token, keep):
+                return self._evict(token, reason)
+        return None
+
+    def _evict(self, token, reason):
+        app, _ = self.sessions.pop(token)
+        self.evictions += 1
+        logging.info(f"Evicted session {token[:8]} ({reason})")
+        return app
+
+    def stats(self):
+        return {"sessions": len(self.sessions), "evictions": self.evictions,
+                "pool_bytes": self.pool_bytes(), "max_sessions": self.max_sessions}
+
+class SavedSessions():
+    """
+    Session settings kept in a directory, one JSON file per token, so that any server worker
+    process can set up a session that was initialized by another.
+
+    Each worker draws from its own quiz pool, so the keys answered in the current quiz round are
+    kept beside the settings, one JSON string per line, for every worker to drop from its pool.
+    start_round() clears them and saves the settings again, whose new stamp has the other workers
+    select words afresh.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def filename(self, token):
+        # Tokens come from clients, so keep them to a plain file name
+        return os.path.join(self.directory, f"{uuid.uuid5(uuid.NAMESPACE_URL, token).hex}.json")
+
+    def answered_filename(self, token):
+        return f"{self.filename(token)[:-5]}.answered"
+
+    # Changes whenever the token's settings are saved, None if there are none
+    def stamp(self, token):
+        try:
+            st = os.stat(self.filename(token))
+            return (st.st_ino, st.st_mtime_ns)
+        except OSError:
+            return None
+
+    def load(self, token):
+        try:
+            with open(self.filename(token), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, token, settings):
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic_write(self.filename(token)) as f:
+            f.write(json.dumps(settings))
+
+    # Save settings, or the saved ones with changes, as the start of a new quiz round. Returns the
+    # new stamp, None if there were no settings to save.
+    def start_round(self, token, settings=None, **changes):
+        settings = settings if settings is not None else self.load(token)
+        self.remove_answered(token)
+        if settings is None: return None
+        self.save(token, {**settings, **changes})
+        return self.stamp(token)
+
+    def add_answered(self, token, keys):
+        if not keys: return
+        os.makedirs(self.directory, exist_ok=True)
+        # One append per call, so lines from different workers don't interleave
+        with open(self.answered_filename(token), 'ab') as f:
+            f.write("".join(json.dumps(key) + "\n" for key in keys).encode('utf-8'))
+
+    # Keys answered this round from byte offset on, and the offset to read from next time
+    def answered(self, token, offset=0):
+        try:
+            with open(self.answered_filename(token), 'rb') as f:
+                # The file was started over since the last read
+                if offset > os.fstat(f.fileno()).st_size: offset = 0
+                f.seek(offset)
+                data = f.read()
+        except OSError:
+            return [], 0
+        # A line still being written is left for the next read
+        end = data.rfind(b"\n") + 1
+        return [json.loads(line) for line in data[:end].splitlines()], offset + end
+
+    def remove_answered(self, token):
+        try:
+            os.remove(self.answered_filename(token))
+        except OSError:
+            pass
+
+    def remove(self, token):
+        self.remove_answered(token)
+        try:
+            os.remove(self.filename(token))
+        except OSError:
+            pass
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
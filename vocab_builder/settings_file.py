@@ -0,0 +1,43 @@
+import os
+import json
+
+from atomic_write import atomic_write
+
+# One SettingsFile per path, shared by every VocabBuilder in the process
+_settings = {}
+
+def open_settings(filename):
+    settings = _settings.get(filename, None)
+    if settings is None:
+        settings = SettingsFile(filename)
+        _settings[filename] = settings
+    return settings
+
+class SettingsFile():
+    """
+    A small JSON settings file, parsed once and re-read only when its mtime changes. version
+    increases each time the contents change, through write() or on disk.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.value = None
+        self.mtime = None
+        self.version = 0
+
+    # Raises OSError or ValueError if the file is missing or unreadable
+    def read(self):
+        mtime = os.stat(self.filename).st_mtime_ns
+        if mtime != self.mtime:
+            with open(self.filename, 'r') as f:
+                self.value = json.load(f)
+            self.mtime = mtime
+            self.version += 1
+        return self.value
+
+    def write(self, value):
+        with atomic_write(self.filename) as f:
+            f.write(json.dumps(value))
+        self.value = value
+        self.mtime = os.stat(self.filename).st_mtime_ns
+        self.version += 1
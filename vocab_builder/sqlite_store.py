@@ -0,0 +1,284 @@
+import json
+import os
+import sqlite3
+import logging
+import uuid
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+from os.path import exists, join, basename, dirname
+
+from vocab_store import normalize, locked
+from atomic_write import atomic_write
+from metrics import metrics, timed
+
+DB_FILE_NAME = "vocab.db"
+VOCAB_FILE_SUFFIX = "_vocab.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vocab (
+    pair TEXT NOT NULL,
+    key TEXT NOT NULL,
+    part TEXT NOT NULL DEFAULT '',
+    count INTEGER NOT NULL DEFAULT 0,
+    last_correct TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (pair, key)
+);
+CREATE INDEX IF NOT EXISTS vocab_count ON vocab (pair, count);
+CREATE INDEX IF NOT EXISTS vocab_last_correct ON vocab (pair, last_correct);
+CREATE INDEX IF NOT EXISTS vocab_part ON vocab (pair, part, last_correct);
+CREATE TABLE IF NOT EXISTS translations (
+    pair TEXT NOT NULL,
+    key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    norm TEXT NOT NULL,
+    PRIMARY KEY (pair, key, position)
+);
+CREATE INDEX IF NOT EXISTS translations_text ON translations (pair, text);
+CREATE INDEX IF NOT EXISTS translations_norm ON translations (pair, norm);
+CREATE TABLE IF NOT EXISTS meta (
+    pair TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_connections = {}
+
+def connect(db_file):
+    conn = _connections.get(db_file, None)
+    if conn is None:
+        conn = sqlite3.connect(db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _connections[db_file] = conn
+    return conn
+
+class SqliteVocabStore():
+    """
+    VocabStore backed by DATA_DIR/vocab.db, where all language pairs share one set of tables with
+    a pair column. It has the same interface as VocabStore. Changes are committed by save(), and
+    checkpoint() exports the pair back to its <to>_<from>_vocab.json file.
+
+    The first time a pair is opened, its existing vocab file is imported.
+
+    As with VocabStore, writers are serialized by an RLock and readers use snapshot(). Writes are
+    visible on the shared connection before they are committed, so snapshot() is what gives
+    readers a consistent view.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.pair = basename(filename)[:-len(VOCAB_FILE_SUFFIX)]
+        self.conn = connect(join(dirname(filename), DB_FILE_NAME))
+        self.dirty = False
+        self.loaded = False
+        # Bumped on every change. With epoch, which differs per process, it identifies the
+        # vocabulary's contents, e.g. for ETags.
+        self.version = 0
+        self.epoch = uuid.uuid4().hex[:8]
+        # Export file path -> "<epoch>-<version>" of the contents written to it
+        self.exports = {}
+        self.bytes_written = 0
+        # Set whenever checkpoint() rewrites the vocab file, cleared once it is backed up
+        self.needs_backup = False
+        self.lock = threading.RLock()
+        self.published = (None, {})
+        # SQLite's count of commits by other connections, including other processes'
+        self.data_version = None
+
+    # SQLite locks the database across processes, so sync has nothing to do here
+    @contextmanager
+    def writing(self, sync=True):
+        with self.lock:
+            yield
+
+    def snapshot(self):
+        published = self.published
+        if published[0] == self.version: return published[1]
+        # Only the very first snapshot has to wait for a writer
+        if not self.lock.acquire(blocking=published[0] is None): return published[1]
+        try:
+            published = (self.version, dict(self.items()))
+            self.published = published
+        finally:
+            self.lock.release()
+        return published[1]
+
+    @locked
+    @timed("vocab_load")
+    def load(self):
+        if self.conn.execute("SELECT 1 FROM meta WHERE pair = ?", (self.pair,)).fetchone() is None:
+            self.import_file()
+        self.loaded = True
+
+    # Pick up commits made through other connections, e.g. by other server workers
+    def refresh(self):
+        if not self.loaded:
+            self.load()
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.data_version:
+            if self.data_version is not None: self.version += 1
+            self.data_version = data_version
+
+    # Replace the pair's rows with the contents of its vocab file
+    @locked
+    def import_file(self):
+        contents = {}
+        if exists(self.filename):
+            with open(self.filename, 'r') as f:
+                metrics.add("vb_bytes_read_total", os.fstat(f.fileno()).st_size, kind="vocab")
+                try:
+                    contents = json.loads(f.read())
+                except Exception as e:
+                    logging.error(f"Unable to parse vocab file {self.filename}: {e}")
+        meta = contents.pop("meta", None)
+        self.replace(contents)
+        self.conn.execute("INSERT OR REPLACE INTO meta (pair, value) VALUES (?, ?)", (self.pair, json.dumps(meta)))
+        self.save()
+        logging.info(f"Imported {len(contents)} entries from {self.filename} into {DB_FILE_NAME}")
+
+    def reload_from_file(self):
+        self.import_file()
+
+    def changed(self):
+        self.dirty = True
+        self.version += 1
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM vocab WHERE pair = ?", (self.pair,)).fetchone()[0]
+
+    def __contains__(self, key):
+        return self.conn.execute("SELECT 1 FROM vocab WHERE pair = ? AND key = ?", (self.pair, key)).fetchone() is not None
+
+    def get(self, key, default=None):
+        row = self.conn.execute("SELECT part, count, last_correct FROM vocab WHERE pair = ? AND key = ?",
+                                (self.pair, key)).fetchone()
+        if row is None: return default
+        translations = [r[0] for r in self.conn.execute(
+            "SELECT text FROM translations WHERE pair = ? AND key = ? ORDER BY position", (self.pair, key))]
+        return {"translations": translations, "lastCorrect": row[2], "count": row[1], "part": row[0]}
+
+    # get() already returns a fresh copy
+    get_mutable = get
+
+    def items(self):
+        translations = {}
+        for key, text in self.conn.execute(
+          "SELECT key, text FROM translations WHERE pair = ? ORDER BY key, position", (self.pair,)):
+            translations.setdefault(key, []).append(text)
+        for key, part, count, last_correct in self.conn.execute(
+          "SELECT key, part, count, last_correct FROM vocab WHERE pair = ? ORDER BY rowid", (self.pair,)):
+            yield key, {"translations": translations.get(key, []), "lastCorrect": last_correct, "count": count, "part": part}
+
+    def keys(self):
+        return [r[0] for r in self.conn.execute("SELECT key FROM vocab WHERE pair = ? ORDER BY rowid", (self.pair,))]
+
+    def as_dict(self):
+        return self.snapshot()
+
+    def keys_for(self, text, normalized=False):
+        column = "norm" if normalized else "text"
+        value = normalize(text) if normalized else text
+        return [r[0] for r in self.conn.execute(
+            f"SELECT DISTINCT v.key FROM translations t JOIN vocab v ON v.pair = t.pair AND v.key = t.key "
+            f"WHERE t.pair = ? AND t.{column} = ? ORDER BY v.rowid", (self.pair, value))]
+
+    def has_translation(self, key, text, normalized=False):
+        column = "norm" if normalized else "text"
+        value = normalize(text) if normalized else text
+        return self.conn.execute(f"SELECT 1 FROM translations WHERE pair = ? AND key = ? AND {column} = ?",
+                                 (self.pair, key, value)).fetchone() is not None
+
+    def keys_with_translations(self, translations):
+        if not translations: return []
+        return [k for k in self.keys_for(translations[0]) if self.get(k)["translations"] == list(translations)]
+
+    def select_due(self, min_age, part_of_speech='Any'):
+        cutoff = (date.today() - timedelta(days=int(min_age))).isoformat()
+        query = "SELECT v.key, t.text FROM vocab v LEFT JOIN translations t ON t.pair = v.pair AND t.key = v.key " + \
+          "WHERE v.pair = ? AND trim(v.key) != '' AND (v.last_correct = '' OR v.last_correct <= ?)"
+        args = [self.pair, cutoff]
+        if part_of_speech != 'Any':
+            query += " AND v.part = ?"
+            args.append(part_of_speech)
+        selected = {}
+        for key, text in self.conn.execute(query + " ORDER BY v.rowid, t.position", args):
+            translations = selected.setdefault(key, [])
+            if text is not None: translations.append(text)
+        return list(selected.items())
+
+    @locked
+    def mark_correct(self, key, day):
+        cursor = self.conn.execute("UPDATE vocab SET count = count + 1, last_correct = ? WHERE pair = ? AND key = ?",
+                                   (day, self.pair, key))
+        if cursor.rowcount == 0: return False
+        self.changed()
+        return True
+
+    @locked
+    def put(self, key, entry):
+        self.conn.execute(
+            "INSERT INTO vocab (pair, key, part, count, last_correct) VALUES (?, ?, ?, ?, ?) " +
+            "ON CONFLICT (pair, key) DO UPDATE SET part = excluded.part, count = excluded.count, last_correct = excluded.last_correct",
+            # The JSON store takes null fields as is, but the columns are NOT NULL
+            (self.pair, key, entry.get("part") or "", entry.get("count") or 0, entry.get("lastCorrect") or ""))
+        self.conn.execute("DELETE FROM translations WHERE pair = ? AND key = ?", (self.pair, key))
+        self.conn.executemany("INSERT INTO translations (pair, key, position, text, norm) VALUES (?, ?, ?, ?, ?)",
+                              [(self.pair, key, i, t, normalize(t)) for i, t in enumerate(entry["translations"])])
+        self.changed()
+
+    # put() for each key and entry of entries
+    @locked
+    def put_many(self, entries):
+        for key, entry in entries.items():
+            self.put(key, entry)
+
+    @locked
+    def delete(self, key):
+        cursor = self.conn.execute("DELETE FROM vocab WHERE pair = ? AND key = ?", (self.pair, key))
+        self.conn.execute("DELETE FROM translations WHERE pair = ? AND key = ?", (self.pair, key))
+        self.changed()
+        return cursor.rowcount > 0
+
+    @locked
+    def replace(self, entries):
+        self.conn.execute("DELETE FROM vocab WHERE pair = ?", (self.pair,))
+        self.conn.execute("DELETE FROM translations WHERE pair = ?", (self.pair,))
+        for key, entry in entries.items():
+            if key != "meta": self.put(key, entry)
+        self.changed()
+
+    # Commit pending changes. The vocab file is never rewritten here, so this always returns False.
+    @locked
+    @timed("vocab_save")
+    def save(self):
+        if self.dirty:
+            self.conn.commit()
+            self.dirty = False
+        return False
+
+    # Export the pair to its vocab file, so file-based exports and backups see current data
+    @locked
+    def checkpoint(self):
+        self.save()
+        row = self.conn.execute("SELECT value FROM meta WHERE pair = ?", (self.pair,)).fetchone()
+        meta = json.loads(row[0]) if row and row[0] else None
+        contents = dict(self.items())
+        if meta is not None: contents = {"meta": meta, **contents}
+        data = json.dumps(contents)
+        with atomic_write(self.filename) as f:
+            f.write(data)
+        self.bytes_written += len(data)
+        metrics.add("vb_bytes_written_total", len(data), kind="vocab")
+        self.needs_backup = True
+
+# One-shot migration of every vocab file in data_dir into vocab.db
+def migrate(data_dir):
+    for file in sorted(os.listdir(data_dir)):
+        if file.endswith(VOCAB_FILE_SUFFIX):
+            SqliteVocabStore(join(data_dir, file)).import_file()
+
+if __name__ == "__main__":
+    from vocab_builder import DATA_DIR
+    migrate(DATA_DIR)
@@ -0,0 +1,136 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from os.path import dirname
+
+from vocab_store import normalize
+
+# Entries kept before the least recently used ones are evicted
+MAX_ENTRIES = int(os.environ.get("VB_TRANSLATION_CACHE_MAX_ENTRIES", 50000))
+# Seconds before a cached translation expires. 0 keeps translations until evicted.
+TTL = float(os.environ.get("VB_TRANSLATION_CACHE_TTL", 0))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    from_lang TEXT NOT NULL,
+    to_lang TEXT NOT NULL,
+    text TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (from_lang, to_lang, text)
+);
+CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+STAT_NAMES = ("hits", "misses", "chars_saved", "evictions")
+
+class TranslationCache():
+    """
+    Persistent cache of translator results, keyed by (from_lang, to_lang, normalized text) and
+    stored in an SQLite file so it survives restarts. Least recently used entries are evicted past
+    max_entries, and entries older than ttl seconds are treated as misses. Hit, miss, eviction
+    and characters-saved counters are persisted with the cache.
+
+    The database is opened on first use. One lock serializes access, so a cache can be shared by
+    the translator's worker threads and the server's greenlets.
+    """
+
+    def __init__(self, filename, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.conn = None
+        self.lock = threading.Lock()
+        self.size = 0
+
+    def _connect(self):
+        if self.conn is None:
+            os.makedirs(dirname(self.filename), exist_ok=True)
+            self.conn = sqlite3.connect(self.filename, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            self.conn.executemany("INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)", [(n,) for n in STAT_NAMES])
+            self.conn.commit()
+            self.size = self.conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        return self.conn
+
+    # Returns {text: translation} for the texts found in the cache
+    def get_many(self, from_lang, to_lang, texts):
+        found = {}
+        now = time.time()
+        with self.lock:
+            try:
+                conn = self._connect()
+                for text in texts:
+                    row = conn.execute("SELECT translation, created FROM translations WHERE from_lang = ? AND to_lang = ? AND text = ?",
+                                       (from_lang, to_lang, normalize(text))).fetchone()
+                    if row is not None and self.ttl and row[1] < now - self.ttl:
+                        conn.execute("DELETE FROM translations WHERE from_lang = ? AND to_lang = ? AND text = ?",
+                                     (from_lang, to_lang, normalize(text)))
+                        self.size -= 1
+                        row = None
+                    if row is not None:
+                        found[text] = row[0]
+                        conn.execute("UPDATE translations SET last_used = ? WHERE from_lang = ? AND to_lang = ? AND text = ?",
+                                     (now, from_lang, to_lang, normalize(text)))
+                self._count(conn, hits=len(found), misses=len(texts) - len(found),
+                            chars_saved=sum(len(t) for t in found))
+                conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Translation cache lookup failed: {e}")
+        return found
+
+    def get(self, from_lang, to_lang, text):
+        return self.get_many(from_lang, to_lang, [text]).get(text, None)
+
+    def put_many(self, from_lang, to_lang, translations):
+        now = time.time()
+        with self.lock:
+            try:
+                conn = self._connect()
+                for text, translation in translations.items():
+                    cursor = conn.execute("INSERT OR IGNORE INTO translations VALUES (?, ?, ?, ?, ?, ?)",
+                                          (from_lang, to_lang, normalize(text), translation, now, now))
+                    if cursor.rowcount:
+                        self.size += 1
+                    else:
+                        conn.execute("UPDATE translations SET translation = ?, created = ?, last_used = ? " +
+                                     "WHERE from_lang = ? AND to_lang = ? AND text = ?",
+                                     (translation, now, now, from_lang, to_lang, normalize(text)))
+                if self.size > self.max_entries:
+                    self._evict(conn, self.size - self.max_entries)
+                conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Translation cache update failed: {e}")
+
+    def put(self, from_lang, to_lang, text, translation):
+        self.put_many(from_lang, to_lang, {text: translation})
+
+    def stats(self):
+        with self.lock:
+            try:
+                conn = self._connect()
+                stats = dict(conn.execute("SELECT name, value FROM stats"))
+            except sqlite3.Error as e:
+                logging.error(f"Translation cache stats failed: {e}")
+                stats = {}
+        stats["entries"] = self.size
+        return stats
+
+    def _evict(self, conn, count):
+        conn.execute("DELETE FROM translations WHERE rowid IN " +
+                     "(SELECT rowid FROM translations ORDER BY last_used LIMIT ?)", (count,))
+        self.size -= count
+        self._count(conn, evictions=count)
+
+    def _count(self, conn, **counts):
+        conn.executemany("UPDATE stats SET value = value + ? WHERE name = ?",
+                         [(v, k) for k, v in counts.items() if v])
@@ -1,15 +1,22 @@
+import logging
+
 # Abstract class
 
 class TranslatorClient():
 
     def get_languages(self):
-        print("Unsupported operation: get_languages")
+        logging.error("Unsupported operation: get_languages")
         return None
 
     def detect_language(self, text):
-        print("Unsupported operation: detect_language")
+        logging.error("Unsupported operation: detect_language")
         return None
 
     def translate(self, text):
-        print("Unsupported operation: translate")
-        return None
\ No newline at end of file
+        logging.error("Unsupported operation: translate")
+        return None
+
+    # Translate a list of texts. Returns {text: translation}.
+    def translate_many(self, from_lang, to_lang, texts):
+        logging.error("Unsupported operation: translate_many")
+        return None
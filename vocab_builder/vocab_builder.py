@@ -16,13 +16,21 @@ import sys, errno
 # import readchar
 import csv
 from datetime import date
-from random import randint
-from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from contextlib import suppress, contextmanager
 from ms_translater_client import MSTranslatorClient
-from contextlib import suppress
+from translation_cache import TranslationCache
+from language_catalog import LanguageCatalog
+from settings_file import open_settings
+from vocab_store import open_store
+from quiz_pool import QuizPool
+from atomic_write import atomic_write
+from metrics import metrics, timed
+from vocab_query import VocabQuery
 import io
+import gzip
+import uuid
 import logging
-from logging.config import dictConfig
+import threading
 
 home_dir_var_name = "HOMEPATH" if platform.system() == "Windows" else "HOME"
 
@@ -38,8 +46,8 @@ except OSError as exception:
       raise
 LOG_FILE_NAME = os.path.join(LOGGING_DIR, "vb.log")
 
-from log_config import config
-dictConfig(config(LOG_FILE_NAME))
+import log_config
+log_config.configure(LOG_FILE_NAME)
 
 #Determine if we're running as a bundle created by PyInstaller
 isBundled =  getattr( sys, 'frozen', False )
@@ -51,31 +59,79 @@ DATA_DIR = os.environ.get("VB_DATA_DIR", None) or \
   os.path.join(os.getenv(home_dir_var_name), VB_DIR, "data")
 PARTS_OF_SPEECH_FILE = "parts_of_speech.json"
 API_KEY_FILE_NAME = "api_key"
+TRANSLATION_CACHE_FILE_NAME = "translation_cache.db"
+LANGUAGE_CATALOG_FILE_NAME = "languages.json"
+DEFAULT_LANGS_FILE_NAME = "default_langs.json"
+# Distinguishes data versions of this process from those of earlier runs
+PROCESS_EPOCH = uuid.uuid4().hex[:8]
+# Seed for the quiz word draws, for reproducible sessions
+QUIZ_SEED = os.environ.get("VB_QUIZ_SEED", None)
+# Rows translated and merged at a time by import_vocab_csv
+IMPORT_CHUNK_SIZE = int(os.environ.get("VB_IMPORT_CHUNK_SIZE", 500))
+# Words listed in an import summary for each kind of skipped row
+IMPORT_SAMPLE_SIZE = 100
+# Set once the initial data files are in DATA_DIR, so they are only checked once per process
+data_files_ready = False
+data_files_lock = threading.Lock()
+
+# Group the non-empty rows of a csv reader into lists of up to size rows, padded to three columns
+def csv_chunks(reader, size):
+    chunk = []
+    for row in reader:
+        if not any(row): continue
+        while len(row) < 3: row.append("")
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Incoming translations as a flat list of strings. The server passes a word through as it was
+# sent, which may be a comma-separated string or a JSON list.
+def flatten(words):
+    if isinstance(words, str): return words.split(',')
+    if isinstance(words, (list, tuple)): return [w for word in words for w in flatten(word)]
+    return [str(words)]
+
+# Count a skipped word in an import summary, keeping a bounded sample of them
+def add_sample(summary, count, samples, word):
+    summary[count] += 1
+    if len(summary[samples]) < IMPORT_SAMPLE_SIZE:
+        summary[samples].append(word)
 
 class VocabBuilder():
   
-    def __init__(self):
+    # Pass client and catalog to share them with another VocabBuilder, e.g. across server sessions
+    def __init__(self, client=None, catalog=None):
       self.initialized = False
-      self.client = MSTranslatorClient(os.path.join(DATA_DIR, API_KEY_FILE_NAME))
+      self.client = client or MSTranslatorClient(os.path.join(DATA_DIR, API_KEY_FILE_NAME),
+        cache=TranslationCache(os.path.join(DATA_DIR, TRANSLATION_CACHE_FILE_NAME)))
+      self.catalog = catalog or LanguageCatalog(os.path.join(DATA_DIR, LANGUAGE_CATALOG_FILE_NAME), self.client)
+      self.pool = QuizPool(seed=QUIZ_SEED)
+      self.import_progress = {}
+      self.selected_count = 0
+      # Nesting depth of batch() blocks. While positive, set_vocab() defers saving to the end of the batch.
+      self.batching = 0
+      # Called with the keys mark_correct() removes from the quiz pool, e.g. to share them with
+      # other server workers
+      self.on_answered = None
       current_dir = os.getcwd()
-      logging.info(f"CWD: {current_dir}")
-      logging.info(f"Data Dir: {DATA_DIR}")
-      logging.info(f"SERVER_PORT: {os.environ.get('SERVER_PORT', None)}")
+      logging.debug("CWD: %s", current_dir)
+      logging.debug("Data Dir: %s", DATA_DIR)
+      logging.debug("SERVER_PORT: %s", os.environ.get('SERVER_PORT', None))
 
     def initialize(self, **kwargs):
         for k,v in kwargs.items():
             setattr(self, k, v)
-        try:
-          if not self.data_files_exist():
-            self.copy_initial_data()
-        except Exception as exception:
-          logging.error(f"Failed to cerate initial data files. {exception}")
+        if "seed" in kwargs: self.pool.seed(kwargs["seed"])
+        if "without_replacement" in kwargs: self.pool.without_replacement = kwargs["without_replacement"]
+        self.ensure_data_files()
         self.vocab_filename = f"{DATA_DIR}{sep}{self.to_lang}_{self.from_lang}_vocab"
         self.vocab_filename_json = f"{self.vocab_filename}.json"
         self.vocab_filename_csv = f"{self.vocab_filename}.csv"
         if not self.no_word_lookup: 
-            langs = self.client.get_languages()
-            self.langs = langs if langs else {}
+            self.langs = self.catalog.languages()
             self.check_langs()
         else:
             self.langs = {}
@@ -83,14 +139,16 @@ class VocabBuilder():
             self.from_langname = self.from_lang
             
         if self.lang_attrs_set(): self.initialize_vocab()
+        self.store = open_store(self.vocab_filename_json)
                 
         if self.cli_launch:
           if self.pr_avail_langs:
               print("Available languages for translation")
               print("Code\t\tName")
               # print(json.dumps(self.langs, sort_keys=True, indent=4, ensure_ascii=False, separators=(',', ': ')))
-              for lang in self.get_avail_langs():
-                  print(f"{lang}\t\t{self.available_langs[lang]['name']}")
+              langs = self.get_avail_langs()
+              for lang in langs:
+                  print(f"{lang}\t\t{langs[lang]['name']}")
               
           elif self.pr_word_cnt:
               vocab = self.get_vocab()
@@ -105,6 +163,28 @@ class VocabBuilder():
               self.run_test_vocab()
         self.initialized = True
         
+    # Copy the initial data files to DATA_DIR if any are missing. Waits if another thread, e.g.
+    # bootstrap() at server start, is already doing it.
+    def ensure_data_files(self):
+      global data_files_ready
+      if data_files_ready: return
+      with data_files_lock:
+        if data_files_ready: return
+        try:
+          if not self.data_files_exist():
+            self.copy_initial_data()
+          data_files_ready = True
+        except Exception as exception:
+          logging.error(f"Failed to cerate initial data files. {exception}")
+
+    # Do the first-request setup ahead of time: copy the initial data files and load the language
+    # catalog, fetching it if there is no cached copy. The server runs this in the background once
+    # it is listening.
+    @timed("bootstrap")
+    def bootstrap(self):
+      self.ensure_data_files()
+      self.catalog.languages()
+
     def copy_initial_data(self):
       try:
         #In pyinstaller, exist_ok will be ignored
@@ -152,9 +232,7 @@ class VocabBuilder():
         return "OK"
         
     def get_avail_langs(self):
-        if not getattr(self, "available_langs", None):
-            self.available_langs = self.client.get_languages()
-        return self.available_langs
+        return self.catalog.languages()
     
     def translate(self, text, from_lang, to_lang):
         from_lang = self.to_id(from_lang)
@@ -164,14 +242,24 @@ class VocabBuilder():
         else:
             return text
     
+    def get_translation_cache_stats(self):
+        return self.client.cache.stats()
+    
+    # Translate a list of words in as few service calls as possible. Returns {word: translation}.
+    def translate_many(self, texts, from_lang, to_lang):
+        from_lang = self.to_id(from_lang)
+        to_lang = self.to_id(to_lang)
+        if to_lang:
+            return self.client.translate_many(from_lang, to_lang, texts)
+        else:
+            return {text: text for text in texts}
+    
     def to_id(self, lang):
-        if lang in self.langs:
-            return lang
-        for k,v in self.langs.items():
-            if lang == v['name'] or lang == v['nativeName']:
-                return k
-        logging.error(f"Invlaid language: {lang}")
-        return None
+        # No catalog is consulted when online lookup is disabled
+        code = self.catalog.to_id(lang) if self.langs else None
+        if code is None:
+            logging.error(f"Invlaid language: {lang}")
+        return code
     
     def kill_app(self):
         sys.exit(0)
@@ -181,10 +269,13 @@ class VocabBuilder():
     
     * Get additional vocab words from a csv file, append them to the existing in-memory vocabulary,
         and save the updated vocabulary as a CSV file
-    * The input CSV content can be a csv file on the file system (CLI mode) or bytes provided in a
-        function call (server mode, providing a file uploaded from the browser)
+    * The input CSV content can be a csv file on the file system (CLI mode) or a binary stream or bytes
+        provided in a function call (server mode, providing a file uploaded from the browser)
+    * Rows are parsed lazily and merged IMPORT_CHUNK_SIZE at a time, so memory use does not grow with
+        the file. on_progress(summary) is called after each chunk, and the final summary is returned.
     """
-    def import_vocab_csv(self, filename=None, file=None):
+    @timed("import_csv")
+    def import_vocab_csv(self, filename=None, file=None, on_progress=None):
         """
         CSV File structure: Three or more columns
         COl 0: Word in "to" language (can be empty string, but only if Col 2 is not empty)
@@ -193,102 +284,125 @@ class VocabBuilder():
         Col 3...n: (optional) Addiitional words in "from" language, i.e. multiple translations of the "to" word
         
         """
-        self.backup_vocab_file()
-        if file:
-            file = io.BytesIO(file)
-            print(f"{len(file.readlines())} words to import")
-            file.seek(0)
-            csvFile = csv.reader(io.TextIOWrapper(file, encoding='utf-8'), quotechar='|',  quoting=csv.QUOTE_NONE)
+        if file is not None:
+            stream = io.BytesIO(file) if isinstance(file, bytes) else file
+            text = io.TextIOWrapper(stream, encoding='utf-8')
         elif filename:
             try:
-              file = open(filename, 'r')
-              print(f"{len(file.readlines())} words to import")
-              file.seek(0)
-              csvFile = csv.reader(file, quotechar='|',  quoting=csv.QUOTE_NONE)
-            except:
-                print(f"Import failed. File {filename} does not exist.")
-                return
+              # Binary underneath, like a given stream: tell() on a text file being iterated raises
+              stream = open(filename, 'rb')
+              text = io.TextIOWrapper(stream, encoding='utf-8')
+            except OSError:
+                logging.error(f"Import failed. File {filename} does not exist.")
+                return None
         else:
-            print("Import failed. No CSV file was specified.")
-            return
-        missed_translation = False
-        untranslated_words = set()
-        translated_words = []
-        extra_translations = []
-        for row in csvFile:
-            if len(row) == 1: row.append("")
-            if row[0] and not row[2]:
-                if not self.no_word_lookup:
-                    row[2] = self.client.translate(self.to_lang, self.from_lang, row[0])
-                if row[2] == row[0]:
-                    #TODO handle case where word is identical in both languages
-                    missed_translation = True
-                    untranslated_words.add(row[0])
-                else:
-                    translated_words.append((row[0], row[1], row[2]))
-            elif row[2] and not row[0]:
-                if not self.no_word_lookup:
-                    row[0] = self.client.translate(self.from_lang, self.to_lang, row[2])
-                if row[0] == row[2]:
-                    #TODO handle case where word is identical in both languages
-                    missed_translation = True
-                    untranslated_words.add(row[2])
-                else:
-                    translated_words.append((row[0], row[1], row[2]))
-            else:
-                translated_words.append((row[0], row[1], row[2]))
-                if len(row) > 3:
-                    for i in range(3, len(row)):
-                        extra_translations.append((row[0], row[i]))
-        if missed_translation:
-            print("The following words were not imported because a translation could not be determined and was not explicitly provided. " +
-                  "This error will also occur if the translation is identical to the original word.")
-            for w in untranslated_words: print(w)
-        
-        vocab = self.get_vocab()
-        duplicate_words = set()
-        duplicate_translation = False
-        for w1, w2, w3 in translated_words:
-            [w1, w2, w3] = [w1.strip(), w2.strip(),  w3.strip()]
-            if not w1 in vocab:
-                vocab[w1] = {
-                    "translations": [w3],
-                    "lastCorrect": "",
-                    "count": 0,
-                    "part": w2
-                }
+            logging.error("Import failed. No CSV file was specified.")
+            return None
+        self.store.checkpoint()
+        self.backup_vocab_file()
+        summary = {"state": "running", "rows": 0, "imported": 0, "extra_translations": 0,
+                   "duplicates": 0, "untranslated": 0, "bytes_read": 0,
+                   "duplicate_words": [], "untranslated_words": []}
+        self.import_progress = summary
+        try:
+            csvFile = csv.reader(text, quotechar='|',  quoting=csv.QUOTE_NONE)
+            for chunk in csv_chunks(csvFile, IMPORT_CHUNK_SIZE):
+                self.import_csv_chunk(chunk, summary)
+                with suppress(OSError, ValueError):
+                    summary["bytes_read"] = stream.tell()
+                if on_progress: on_progress(summary)
+            self.set_vocab()
+            summary["state"] = "done"
+            metrics.add("vb_bytes_read_total", summary["bytes_read"], kind="import")
+        except Exception as e:
+            summary["state"] = "failed"
+            summary["error"] = str(e)
+            raise
+        finally:
+            # Leave a caller's stream open
+            if file is not None and not isinstance(file, bytes):
+                text.detach()
             else:
-                val = vocab[w1]
-                if w3 in val["translations"]:
-                    duplicate_translation = True
-                    duplicate_words.add(w3)
-                else:
-                    val["translations"].append(w3)
-                    val["part"] = w2
-        if extra_translations:
-            for w1, w2 in extra_translations:
-                [w1, w2] = [w1.strip(), w2.strip()]
-                val = vocab[w1]
-                if w2 not in val["translations"]:
-                    val["translations"].append(w2)
-        if duplicate_translation:
-            print("The following words were not imported because a translation entry already exists")
-            for w in duplicate_words: print(w)
-        self.set_vocab(vocab)
-        print(f"{len(translated_words) - len(duplicate_words)} words imnported")
+                text.close()
+        if summary["untranslated"]:
+            logging.warning("%d words were not imported because a translation could not be determined and was not explicitly provided, " +
+                            "or is identical to the original word, e.g. %s", summary["untranslated"], summary["untranslated_words"][:10])
+        if summary["duplicates"]:
+            logging.info("%d translations were not imported because they already exist, e.g. %s",
+                         summary["duplicates"], summary["duplicate_words"][:10])
+        logging.info("%d of %d rows imported", summary["imported"], summary["rows"])
         # Save a csv copy of the vocab json file
         self.save_vocab_csv()
-        if file:
-            file.close()
+        return summary
+
+    # Translate the rows of a chunk that are missing a side, then merge the chunk into the vocab
+    def import_csv_chunk(self, rows, summary):
+        to_from = from_to = {}
+        if not self.no_word_lookup:
+            to_from = self.client.translate_many(self.to_lang, self.from_lang,
+                                                 [row[0] for row in rows if row[0] and not row[2]]) or {}
+            from_to = self.client.translate_many(self.from_lang, self.to_lang,
+                                                 [row[2] for row in rows if row[2] and not row[0]]) or {}
+        vocab = self.store
+        # Translations are fetched above, outside the writer lock: a lookup can yield to other
+        # greenlets while it backs off, and nothing may yield inside writing() (see VocabStore)
+        with vocab.writing():
+            for row in rows:
+                summary["rows"] += 1
+                extra = []
+                if row[0] and not row[2]:
+                    if not self.no_word_lookup:
+                        row[2] = to_from.get(row[0], None) or row[0]
+                    if row[2] == row[0]:
+                        #TODO handle case where word is identical in both languages
+                        add_sample(summary, "untranslated", "untranslated_words", row[0])
+                        continue
+                elif row[2] and not row[0]:
+                    if not self.no_word_lookup:
+                        row[0] = from_to.get(row[2], None) or row[2]
+                    if row[0] == row[2]:
+                        #TODO handle case where word is identical in both languages
+                        add_sample(summary, "untranslated", "untranslated_words", row[2])
+                        continue
+                else:
+                    extra = row[3:]
+                [w1, w2, w3] = [row[0].strip(), row[1].strip(),  row[2].strip()]
+                if not w1 in vocab:
+                    vocab.put(w1, {
+                        "translations": [w3],
+                        "lastCorrect": "",
+                        "count": 0,
+                        "part": w2
+                    })
+                    summary["imported"] += 1
+                else:
+                    val = vocab.get_mutable(w1)
+                    if vocab.has_translation(w1, w3):
+                        add_sample(summary, "duplicates", "duplicate_words", w3)
+                    else:
+                        val["translations"].append(w3)
+                        val["part"] = w2
+                        vocab.put(w1, val)
+                        summary["imported"] += 1
+                if extra:
+                    val = vocab.get_mutable(w1)
+                    added = list(dict.fromkeys(w.strip() for w in extra if not vocab.has_translation(w1, w.strip())))
+                    if added:
+                        val["translations"].extend(added)
+                        vocab.put(w1, val)
+                        summary["extra_translations"] += len(added)
 
     # CALLED FROM SERVER
     # Save file uploaded from browser
+    @timed("import_json")
     def import_vocab_json(self, file=None):
        if file:
+         self.store.checkpoint()
          self.backup_vocab_file()
          file.save(f"{self.vocab_filename_json}")
+         self.store.reload_from_file()
        else:
-           print("Import failed. No JSON file was specified.")
+           logging.error("Import failed. No JSON file was specified.")
       
     # CALLED FROM SERVER
     # Download saved CSV vocab file to browser
@@ -298,206 +412,220 @@ class VocabBuilder():
               if file:
                 return file.read()
         except:
-          print(f"File {self.vocab_filename_csv} does not exist")
+          logging.error("File %s does not exist", self.vocab_filename_csv)
           return []
     
+    # CALLED FROM SERVER
+    # Path of an up-to-date json or csv export of the vocab (gzipped if compressed), and an ETag
+    # for its contents. Files are only rewritten when the vocab changed since they were last written.
+    def export_vocab_file(self, fmt, compressed=False):
+        store = self.store
+        etag = f"{store.epoch}-{store.version}"
+        if fmt == "json":
+            path = self.vocab_filename_json
+            if store.exports.get(path, None) != etag: store.checkpoint()
+        else:
+            path = self.exported_words_filename()
+            if store.exports.get(path, None) != etag: self.save_vocab_csv()
+        store.exports[path] = etag
+        if not compressed:
+            return path, etag
+        gz_path = f"{path}.gz"
+        if store.exports.get(gz_path, None) != etag:
+            with metrics.timer("export_gzip"), open(path, 'rb') as src, \
+              atomic_write(gz_path, 'wb', opener=gzip.open) as dst:
+                shutil.copyfileobj(src, dst)
+            store.exports[gz_path] = etag
+            metrics.add("vb_bytes_written_total", os.path.getsize(gz_path), kind="export")
+        return gz_path, f"{etag}-gz"
+    
     # CALLED FROM SERVER
     # Download saved JSON vocab file to browser
     def export_vocab_json(self):
+        self.store.checkpoint()
         try:
           with open(f"{self.vocab_filename_json}") as file:
               if file:
                 return file.read()
         except:
-          print(f"File {self.vocab_filename_json} does not exist")
+          logging.error("File %s does not exist", self.vocab_filename_json)
           return []
     
   
+    @timed("select_words")
     def select_words(self):
-        def select(entry):
-            retval = True
-            k,v = entry
-            if k == 'meta' or k.strip() == '':
-                retval = False
-            else:
-              if v["count"] <= self.min_correct:
-                  retval &= True
-              if not len(v["lastCorrect"]):
-                  retval &= True
-              else:
-                last_correct = date.fromisoformat(v['lastCorrect'])
-                delta_days = (date.today() - last_correct).days
-                retval &= (delta_days >= int(self.min_age))
-              if self.part_of_speech != 'Any':
-                try:
-                  retval &= (v['part'] == self.part_of_speech)
-                except:
-                    print(str(v))
-            return retval
-        
-        vocab = dict(filter(select, self.get_vocab().items()))
+        selected = self.store.select_due(self.min_age, self.part_of_speech)
         if self.word_order == "from-to":
-                vals = list(map( lambda item: item[1]['translations'], filter(lambda item: item[0] != "meta" and item[0].strip() != '', vocab.items())))
-                #Now flatten it
-                self.selected_words = [item for sublist in vals for item in sublist]
+                #One pool item per translation of the selected entries
+                self.pool.fill([(k, item) for k, translations in selected for item in translations])
         else:
-            self.selected_words = list(filter(lambda k: k != "meta" and k.strip() != '', vocab.keys()))
+            self.pool.fill([(k, k) for k, translations in selected])
         self.selected_count = 0
-        return len(self.selected_words)
+        return len(self.pool)
     
     def next_word(self):
-        if not len(self.selected_words):
+        item = self.pool.draw()
+        if item is None:
             return None
-        idx = randint(0, len(self.selected_words) - 1)
         self.selected_count+= 1
-        return {"text": self.selected_words[idx], "count": self.selected_count, "size": len(self.selected_words)}
-        #Word is removed from selected_words in run_test_vocab method, only if user knew the translation
+        return {"text": item[1], "count": self.selected_count, "size": len(self.pool)}
+        #Word is removed from the pool in mark_correct, only if user knew the translation
 
     def get_vocab_entry(self, word):
-      vocab = self.get_vocab()
       if self.word_order == 'from-to':
           return list(map(lambda w: w.strip(), word.split(',')))
-      for entry in vocab.items():
-        if entry[0] == "meta": continue
-        for w in entry[1]["translations"]:
-            if w == word:
-                return entry[0]
-      return None
+      keys = self.store.keys_for(word)
+      return keys[0] if keys else None
     
     def get_word_in_other_lang(self, word):
-        vocab = self.get_vocab()
         translations = []
         if self.word_order == 'to-from':
-            for entry in vocab.items():
-              if entry[0] == "meta": continue
-              for w in entry[1]["translations"]:
-                  if w == word:
-                      translations.append(entry[0])
-                      break
+            translations = self.store.keys_for(word)
         else:
-          entry = vocab.get(word, None)
+          entry = self.store.get(word, None)
           if entry: translations = entry['translations']
         return translations
             
 
+    # Returns True if any vocab entry was marked
     def mark_correct(self, word):
-        vocab = self.get_vocab()
+        marked = False
+        answered = []
         keys = self.get_vocab_entry(word)
         if not isinstance(keys, list): keys = [keys]
         for key in keys:
-          entry = vocab.get(key, None)
-          if entry is not None:
-            entry['count']+= 1
-            entry['lastCorrect'] = date.today().isoformat()
-            self.set_vocab(vocab)
-            with suppress(ValueError):
-              # The word to be removed will be given in the oposite language in which
-              # the list of selected words is represented.
-              words = word.split(',') if isinstance(word, str) else [word]
-              word = words[0].strip() if len(words) else ''
-              to_remove = self.get_word_in_other_lang(word)
-              for word in to_remove:
-                self.selected_words.remove(word)
+          if key is not None and self.store.mark_correct(key, date.today().isoformat()):
+            marked = True
+            self.set_vocab()
+            # In from-to order the answered key's translations are removed from the pool. In to-from
+            # order the word is a translation, and every key sharing it is removed.
+            if self.word_order == 'to-from':
+              answered.extend(self.get_word_in_other_lang(word))
+            else:
+              answered.append(key)
+        for k in answered:
+          self.pool.remove_key(k)
+        if answered and self.on_answered: self.on_answered(answered)
+        return marked
     
     def get_parts_of_speech(self):
       logging.debug("Get parts of speech")
+      self.ensure_data_files()
       file = os.path.join(DATA_DIR, PARTS_OF_SPEECH_FILE)
       try:
-        with open(file, 'r') as f:
-          parts = json.load(f)
-          return parts
+        return open_settings(file).read()
       except Exception as e:
             logging.error(f"Cannot get parts of speech. File {file} does not exist")
             return []
     
     def set_parts_of_speech(self, parts):
       try:
-          s = json.dumps(parts)
+          json.dumps(parts)
       except:
           logging.error(f"Uable to parse parts of speech as json: {str(parts)}")
           return False
-      file = os.path.join(DATA_DIR, PARTS_OF_SPEECH_FILE)
-      with open(file, 'w+') as f:
-          f.write(s)
+      open_settings(os.path.join(DATA_DIR, PARTS_OF_SPEECH_FILE)).write(parts)
       return True
 
+    # Version token of the data behind a read endpoint: "vocab", "parts_of_speech",
+    # "default_langs" or "languages". It changes whenever that data changes.
+    def data_version(self, name):
+      if name == "vocab":
+        return f"{self.store.epoch}-{self.store.version}"
+      if name == "languages":
+        return f"{PROCESS_EPOCH}-{self.catalog.fetched}"
+      file = PARTS_OF_SPEECH_FILE if name == "parts_of_speech" else DEFAULT_LANGS_FILE_NAME
+      settings = open_settings(os.path.join(DATA_DIR, file))
+      with suppress(OSError, ValueError):
+        settings.read()
+      return f"{PROCESS_EPOCH}-{settings.version}"
+
     # Save a copy of the vocab json file
+    @timed("vocab_backup")
     def backup_vocab_file(self):
-        shutil.copy2(self.vocab_filename_json, f"{self.vocab_filename_json}.bk")
+        with open(self.vocab_filename_json, 'rb') as src, atomic_write(f"{self.vocab_filename_json}.bk", 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+            size = dst.tell()
+        metrics.add("vb_bytes_written_total", size, kind="backup")
+        self.store.needs_backup = False
     
     def delete_entry(self, key):
-        vocab = self.get_vocab()
-        if key in vocab:
-            del vocab[key]
-            self.set_vocab(vocab)
+        if self.store.delete(key):
+            self.set_vocab()
+            return True
+        return False
+
+    # Apply several mutations with a single save (and backup) at the end, e.g.
+    #   with app.batch():
+    #       for key in keys: app.delete_entry(key)
+    @contextmanager
+    def batch(self):
+        with self.store.writing():
+            self.batching += 1
+            try:
+                yield
+            finally:
+                self.batching -= 1
+                if self.batching == 0:
+                    self.set_vocab()
         
+    # Served from the in-memory store. The returned dict must be treated as read-only.
     def get_vocab(self, l1=None, l2=None):
         if l1 == None or l2 == None:
-            vocab_file = self.vocab_filename_json
-        else:
-            vocab_file = f"{DATA_DIR}{sep}{l2}_{l1}_vocab.json"
-        if exists(vocab_file):
-            with open(vocab_file, 'r') as f:
-                contents = f.read()
-                try:
-                    contents = json.loads(contents).items()
-                    filtered = dict(filter(lambda el: el[0] != "meta", contents))
-                except:
-                    filtered = {}
-                return filtered
-        else:
-            return {}
+            return self.store.as_dict()
+        return open_store(f"{DATA_DIR}{sep}{l2}_{l1}_vocab.json").as_dict()
+
+    # A page of entries selected by a VocabQuery; see vocab_query.py for the arguments. Due status
+    # uses the session's min_age unless one is given.
+    def query_vocab(self, **kwargs):
+        kwargs.setdefault("min_age", self.min_age)
+        return VocabQuery(**kwargs).run(self.store.snapshot().items())
         
     def get_saved_translation(self, word):
-        vocab = self.get_vocab()
         if self.word_order == "to-from":
-            return ",".join(vocab[word]["translations"])
+            return ",".join(self.store.get(word)["translations"])
         else:
-            trans = ""
-            done = False
-            for k, v in vocab.items():
-                if done: break
-                if k == "meta": continue
-                for w in v["translations"]:
-                    if w == word:
-                        trans = k
-                        done = True
-                        break
-            return trans 
+            keys = self.store.keys_for(word)
+            return keys[0] if keys else ""
     
-    # Write vocab entries in memory to json file
-    def set_vocab(self, vocab):
-        with open(self.vocab_filename_json, 'w+') as f:
-            f.write(json.dumps(vocab))
-        self.backup_vocab_file()
+    # Write vocab entries in memory to json file. If vocab is given, it replaces the in-memory entries.
+    def set_vocab(self, vocab=None):
+        with self.store.writing():
+          if vocab is not None:
+              self.store.replace(vocab)
+          if self.batching: return
+          self.store.save()
+          # With several workers, the mutation's own writing() block may already have saved
+          if self.store.needs_backup:
+              self.backup_vocab_file()
             
     def merge_vocab(self, new_words, force=False, update=False):
-        vocab = self.get_vocab()
-        for w_from, w_to, part_of_speech in new_words:
-            if isinstance(w_from, str):
-                w_from_l = w_from.split(',')
-            else:
-                w_from_l = w_from
-            if w_to in vocab:
-                trans = vocab[w_to]["translations"]
-                found = False
-                for w in w_from_l:
-                  if w.strip().lower() in map(lambda x: x.strip().lower(), trans):
-                    found = True
-                    break
-                if not found:
-                  trans.append(w_from)
-                vocab[w_to]['part'] = part_of_speech
-            else:
-                if update:
-                   vocab = dict(filter(lambda x: x[1]['translations'] != w_from_l, vocab.items()))
-                vocab[w_to] = {"translations": w_from_l, "lastCorrect": "", "count": 0, "part": part_of_speech}
-                
-        self.set_vocab(vocab)
+        vocab = self.store
+        # Merged entries not yet in the store, put in one go at the end
+        pending = {}
+        with self.batch():
+            for w_from, w_to, part_of_speech in new_words:
+                w_from_l = flatten(w_from)
+                # A word merged twice, or deleting by translations, needs the store up to date
+                if w_to in pending or (update and pending):
+                    vocab.put_many(pending)
+                    pending = {}
+                entry = vocab.get_mutable(w_to)
+                if entry is not None:
+                    if not any(vocab.has_translation(w_to, w, normalized=True) for w in w_from_l):
+                      entry["translations"].append(w_from if isinstance(w_from, str) else ",".join(w_from_l))
+                    entry['part'] = part_of_speech
+                    pending[w_to] = entry
+                else:
+                    if update:
+                       for k in vocab.keys_with_translations(w_from_l):
+                           vocab.delete(k)
+                    pending[w_to] = {"translations": w_from_l, "lastCorrect": "", "count": 0, "part": part_of_speech}
+            vocab.put_many(pending)
     
     def initialize_vocab(self):
         if not exists(self.vocab_filename_json):
-            with open(self.vocab_filename_json, 'w') as f:
+            with atomic_write(self.vocab_filename_json) as f:
                 f.write(json.dumps({"meta": {
                     "val_langid": f"{self.from_lang}",
                     "val_langname": f"{self.from_langname}",
@@ -506,21 +634,23 @@ class VocabBuilder():
                 }}))
                 
     def set_default_langs(self, frm, to):
-         with open(f"{DATA_DIR}{sep}default_langs.json", 'w+') as f:
-            f.write(json.dumps({"from": frm, "to": to}))
+         open_settings(f"{DATA_DIR}{sep}{DEFAULT_LANGS_FILE_NAME}").write({"from": frm, "to": to})
             
     def get_default_langs(self):
+        self.ensure_data_files()
         try:
-          with open(f"{DATA_DIR}{sep}default_langs.json", 'r') as f:
-              default_langs = json.loads(f.read())
-              return default_langs
+          return open_settings(f"{DATA_DIR}{sep}{DEFAULT_LANGS_FILE_NAME}").read()
         except:
             return {}
 
     # Save the in-memory vocab as a csv file            
+    def exported_words_filename(self):
+        return f"{DATA_DIR}{sep}{self.to_lang}_{self.from_lang}_exported_words.csv"
+
+    @timed("export_csv")
     def save_vocab_csv(self):
         vocab = self.get_vocab()
-        with open(f"{DATA_DIR}{sep}{self.to_lang}_{self.from_lang}_exported_words.csv", "w+") as file:
+        with atomic_write(self.exported_words_filename()) as file:
             csvwriter = csv.writer(file,  quotechar='|',  lineterminator='\n', quoting=csv.QUOTE_NONE)
             for k,v in vocab.items():
                 if k == "meta": continue
@@ -531,18 +661,14 @@ class VocabBuilder():
                 try:
                     csvwriter.writerow(row)
                 except:
-                    print(f"Bad row: {row}")
-                
+                    logging.warning("Bad row: %s", row)
+        metrics.add("vb_bytes_written_total", os.path.getsize(self.exported_words_filename()), kind="export")
+
     def check_langs(self):
-        found_from = found_to = False
-        for k,v in self.langs.items():
-            if k == self.from_lang:
-                found_from = True
-                self.from_langname = v["name"]
-            elif k == self.to_lang:
-                found_to = True
-                self.to_langname = v["name"]
-            if found_from and found_to: break
+        found_from = self.from_lang in self.langs
+        found_to = self.to_lang in self.langs
+        if found_from: self.from_langname = self.langs[self.from_lang]["name"]
+        if found_to: self.to_langname = self.langs[self.to_lang]["name"]
         if not found_from or not found_to:
             missing = (self.from_lang if not found_from else "") + (f" {self.to_lang}" if not found_to else "")
             return f"The following language(s) were specified but are not available: {missing}"
@@ -561,7 +687,8 @@ class VocabBuilder():
             [lang1, lang2] = [lang2, lang1]
         self.select_words()
         while not done:
-            word = self.next_word()['text']
+            res = self.next_word()
+            word = res['text'] if res else None
             if word is None:
                 print("No more words to review for this round")
                 done = True
@@ -623,6 +750,7 @@ class VocabBuilder():
     
             
 if __name__ == "__main__":
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
     parser = ArgumentParser(prog="Vocab Builder", add_help=False,
                             description="A vocabulary practice tool for learning a foreign language",
                             formatter_class=ArgumentDefaultsHelpFormatter)
@@ -0,0 +1,200 @@
+import logging
+import threading
+from collections.abc import Mapping
+from datetime import date
+
+# Entry fields in the vocab file schema, in the order they are written
+FIELDS = ("translations", "lastCorrect", "count", "part")
+
+# Part of speech names by code, and codes by name. Codes are handed out as parts are first seen
+# and never leave the process: files and responses always carry the names.
+PARTS = []
+PART_CODES = {}
+parts_lock = threading.Lock()
+
+# Day ordinals by lastCorrect string, and the strings back by ordinal, so entries last correct on
+# the same day share one int and one string. 0 is "", never answered correctly.
+DAYS = {"": 0}
+DAY_STRINGS = {0: ""}
+
+def part_code(part):
+    code = PART_CODES.get(part, None)
+    if code is None:
+        with parts_lock:
+            code = PART_CODES.get(part, None)
+            if code is None:
+                code = len(PARTS)
+                PARTS.append(part)
+                PART_CODES[part] = code
+    return code
+
+# Day ordinal of an ISO date string, None if it isn't one
+def parse_day(value):
+    day = DAYS.get(value, None)
+    if day is not None: return day
+    try:
+        day = date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return None
+    # Only cache the canonical spelling, so day_string() gives back what was parsed
+    if date.fromordinal(day).isoformat() == value:
+        DAYS[value] = day
+        DAY_STRINGS[day] = value
+    return day
+
+# Day ordinal of "" or a date in canonical ISO form, which day_string() turns back into the same
+# string. None for anything else.
+def canonical_day(value):
+    day = DAYS.get(value, None)
+    if day is not None: return day
+    day = parse_day(value)
+    return day if day is not None and day_string(day) == value else None
+
+def day_string(day):
+    value = DAY_STRINGS.get(day, None)
+    if value is None:
+        value = date.fromordinal(day).isoformat()
+        DAYS[value] = day
+        DAY_STRINGS[day] = value
+    return value
+
+# Translations as a tuple. With a strings dict, equal strings are shared through it, e.g. across
+# every entry of a file as it is loaded.
+def share(translations, strings=None):
+    if strings is None: return tuple(translations)
+    try:
+        return tuple(map(strings.setdefault, translations, translations))
+    except TypeError:
+        # Unhashable values, which only a hand-edited file would have
+        return tuple(translations)
+
+# Day ordinal of a lastCorrect value, 0 if the word was never answered correctly
+def day_ordinal(last_correct):
+    if not last_correct: return 0
+    day = parse_day(last_correct)
+    if day is None:
+        logging.warning(f"Invalid lastCorrect date: {last_correct}")
+        return 0
+    return day
+
+class Entry(Mapping):
+    """
+    A vocab entry held compactly: translations as a tuple, lastCorrect as a day ordinal and part as
+    a code into PARTS, in __slots__ rather than a dict per entry. Entries read
+    as immutable mappings in the vocab file schema, so entry["lastCorrect"], entry.get("part")
+    and {**entry} work as they do on the dicts loaded from the file, except that translations are
+    a tuple. Use to_dict() for a dict to modify.
+
+    Conversion is lossless: a field with a value of an unexpected type, a lastCorrect that isn't a
+    date in canonical ISO form, or a field outside the schema is kept as is in extra, and to_dict()
+    returns a dict equal to the one the entry was made from. A field the dict didn't have is None.
+    """
+
+    __slots__ = ("translations", "day", "count", "part_code", "extra")
+
+    def __init__(self, translations, day, count, part_code, extra=None):
+        self.translations = translations
+        self.day = day
+        self.count = count
+        self.part_code = part_code
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, entry, strings=None):
+        if type(entry) is cls: return entry
+        # Entries as written by the app: the four fields, with a lastCorrect and part seen before
+        if len(entry) == 4:
+            translations, last_correct = entry.get("translations", None), entry.get("lastCorrect", None)
+            count, part = entry.get("count", None), entry.get("part", None)
+            if type(translations) is list and type(count) is int and type(last_correct) is str and type(part) is str:
+                day, code = DAYS.get(last_correct, None), PART_CODES.get(part, None)
+                if day is not None and code is not None:
+                    return cls(share(translations, strings), day, count, code)
+        translations = day = count = code = extra = None
+        for field, value in entry.items():
+            if field == "translations" and type(value) in (list, tuple):
+                translations = share(value, strings)
+                continue
+            if field == "lastCorrect" and type(value) is str:
+                day = canonical_day(value)
+                if day is not None: continue
+            elif field == "count" and type(value) is int:
+                count = value
+                continue
+            elif field == "part" and type(value) is str:
+                code = part_code(value)
+                continue
+            if extra is None: extra = {}
+            extra[field] = value
+        return cls(translations, day, count, code, extra)
+
+    # A copy with the given fields, e.g. {"count": 2}, changed
+    def updated(self, fields):
+        return Entry.from_dict({**self.to_dict(), **fields})
+
+    # A copy answered correctly once more, on day, an ISO date string
+    def marked_correct(self, day):
+        ordinal = canonical_day(day)
+        if self.extra or self.count is None or ordinal is None:
+            return self.updated({"count": self["count"] + 1, "lastCorrect": day})
+        return Entry(self.translations, ordinal, self.count + 1, self.part_code)
+
+    @property
+    def part(self):
+        return PARTS[self.part_code] if self.part_code is not None else None
+
+    # Day ordinal for due checks: 0 if never answered correctly or lastCorrect isn't a date
+    def due_day(self):
+        if self.day is not None: return self.day
+        return day_ordinal(self.extra.get("lastCorrect", None)) if self.extra else 0
+
+    # A plain dict in the vocab file schema, with translations as a list
+    def to_dict(self):
+        result = {}
+        if self.translations is not None: result["translations"] = list(self.translations)
+        if self.day is not None: result["lastCorrect"] = day_string(self.day)
+        if self.count is not None: result["count"] = self.count
+        if self.part_code is not None: result["part"] = PARTS[self.part_code]
+        if self.extra: result.update(self.extra)
+        return result
+
+    def __getitem__(self, field):
+        if field == "translations": value = self.translations
+        elif field == "lastCorrect": value = day_string(self.day) if self.day is not None else None
+        elif field == "count": value = self.count
+        elif field == "part": value = PARTS[self.part_code] if self.part_code is not None else None
+        else: value = None
+        if value is None:
+            if self.extra and field in self.extra: return self.extra[field]
+            raise KeyError(field)
+        return value
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        for field, value in zip(FIELDS, (self.translations, self.day, self.count, self.part_code)):
+            if value is not None: yield field
+        if self.extra: yield from self.extra
+
+    def __len__(self):
+        return sum(v is not None for v in (self.translations, self.day, self.count, self.part_code)) + \
+          (len(self.extra) if self.extra else 0)
+
+    # Equal to a mapping with the same fields, whether its translations are a list or a tuple
+    def __eq__(self, other):
+        if not isinstance(other, Mapping): return NotImplemented
+        return self.to_dict() == Entry.from_dict(other).to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Entry({self.to_dict()!r})"
+
+# json.dumps default= hook writing entries in the vocab file schema
+def entry_json(value):
+    if isinstance(value, Entry): return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,114 @@
+import json
+import base64
+import heapq
+from datetime import date
+
+from vocab_store import normalize
+from vocab_entry import Entry, day_ordinal
+
+SORT_FIELDS = ("key", "count", "lastCorrect")
+ENTRY_FIELDS = ("translations", "lastCorrect", "count", "part")
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Opaque cursor holding the sort position of the last entry on a page
+def make_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+def parse_cursor(cursor):
+    try:
+        value, key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (value, key)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+# Day ordinal of an entry's lastCorrect. An Entry already holds it, so only dicts are parsed.
+def entry_day(entry):
+    if type(entry) is Entry: return entry.due_day()
+    return day_ordinal(entry.get("lastCorrect", ""))
+
+def sort_value(key, entry, sort):
+    if sort == "key": return key
+    if sort == "count": return entry.get("count", 0)
+    return entry.get("lastCorrect", "")
+
+class VocabQuery():
+    """
+    A page of vocab entries, selected from (key, entry) items without serializing the whole
+    vocabulary. Entries can be filtered by part of speech, due status, count range and a substring
+    of the key or a translation, sorted by key, count or lastCorrect, and projected onto a subset
+    of fields.
+
+    Pages are addressed by cursor rather than offset: the cursor holds the (sort value, key) of the
+    last entry returned, so paging stays consistent while entries are added or removed.
+    """
+
+    def __init__(self, sort="key", descending=False, part=None, due=None, min_age=0, min_count=None,
+                 max_count=None, contains=None, fields=None, limit=DEFAULT_LIMIT, cursor=None):
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Invalid sort field {sort}. Expected one of {', '.join(SORT_FIELDS)}")
+        if fields is not None:
+            unknown = [f for f in fields if f not in ENTRY_FIELDS]
+            if unknown:
+                raise ValueError(f"Invalid fields {', '.join(unknown)}. Expected any of {', '.join(ENTRY_FIELDS)}")
+        if limit < 1:
+            raise ValueError(f"Invalid limit {limit}")
+        self.sort = sort
+        self.descending = descending
+        self.part = part if part != 'Any' else None
+        self.due = due
+        self.cutoff = date.today().toordinal() - int(min_age)
+        self.min_count = min_count
+        self.max_count = max_count
+        self.contains = normalize(contains) if contains else None
+        self.fields = fields
+        self.limit = min(limit, MAX_LIMIT)
+        self.after = parse_cursor(cursor) if cursor else None
+
+    def matches(self, key, entry):
+        if self.part is not None and entry.get("part", None) != self.part:
+            return False
+        count = entry.get("count", 0)
+        if self.min_count is not None and count < self.min_count: return False
+        if self.max_count is not None and count > self.max_count: return False
+        if self.due is not None:
+            # Same rule as VocabStore.select_due
+            due = key.strip() != '' and entry_day(entry) <= self.cutoff
+            if due != self.due: return False
+        if self.contains is not None and self.contains not in normalize(key) and \
+          not any(self.contains in normalize(t) for t in entry["translations"]):
+            return False
+        return True
+
+    def project(self, key, entry):
+        fields = self.fields if self.fields is not None else ENTRY_FIELDS
+        projected = {"key": key}
+        for f in fields:
+            projected[f] = entry.get(f, None)
+        return projected
+
+    # Returns {"entries": [...], "total": <matching entries>, "size": <all entries>, "next": <cursor or None>}
+    def run(self, items):
+        size = 0
+        total = 0
+        candidates = []
+        for key, entry in items:
+            size += 1
+            if not self.matches(key, entry): continue
+            total += 1
+            position = (sort_value(key, entry, self.sort), key)
+            if self.after is not None and \
+              (position <= self.after if not self.descending else position >= self.after):
+                continue
+            candidates.append((position, key, entry))
+        # One extra entry tells whether there is a next page
+        select = heapq.nlargest if self.descending else heapq.nsmallest
+        page = select(self.limit + 1, candidates, key=lambda c: c[0])
+        more = len(page) > self.limit
+        page = page[:self.limit]
+        return {
+            "entries": [self.project(key, entry) for _, key, entry in page],
+            "total": total,
+            "size": size,
+            "next": make_cursor(page[-1][0]) if more else None,
+        }
@@ -0,0 +1,529 @@
+import gc
+import json
+import os
+import time
+import logging
+import uuid
+import threading
+from bisect import bisect_right, insort
+from contextlib import contextmanager
+from functools import wraps
+from datetime import date
+from os.path import exists
+
+from atomic_write import atomic_write
+from metrics import metrics, timed
+from process_lock import ProcessLock
+from vocab_entry import Entry, entry_json
+
+# "snapshot" rewrites the whole vocab file on every save. "journal" appends each mutation to
+# <vocab file>.journal and only rewrites the file when the journal is compacted. "sqlite" keeps
+# every language pair in DATA_DIR/vocab.db (see sqlite_store.py).
+PERSISTENCE = os.environ.get("VB_PERSISTENCE", "snapshot")
+# When to fsync the journal: "always" (every save), "interval" or "never" (leave it to the OS)
+JOURNAL_FSYNC = os.environ.get("VB_JOURNAL_FSYNC", "interval")
+JOURNAL_FSYNC_INTERVAL = float(os.environ.get("VB_JOURNAL_FSYNC_INTERVAL", 1.0))
+# Compact the journal into the vocab file once it grows past this many bytes
+JOURNAL_MAX_BYTES = int(os.environ.get("VB_JOURNAL_MAX_BYTES", 1024 * 1024))
+# Server worker processes sharing the data files (see server.py). With more than one, writes take
+# a cross-process file lock and announce themselves through a version stamp file.
+SHARED = int(os.environ.get("VB_WORKERS", 1)) > 1
+
+# One store per vocab file, shared by every VocabBuilder in the process
+_stores = {}
+
+def normalize(text):
+    return text.strip().lower()
+
+# Hold off the cyclic garbage collector while building or serializing a whole vocabulary. The
+# objects made are long-lived or acyclic, but their number alone sets off full collections that
+# rescan everything loaded so far, for about half of the time spent.
+@contextmanager
+def gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled: gc.enable()
+
+# Run a store method inside the store's writing() block
+def locked(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.writing():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def open_store(filename):
+    store = _stores.get(filename, None)
+    if store is None:
+        if PERSISTENCE == "sqlite":
+            from sqlite_store import SqliteVocabStore
+            store = SqliteVocabStore(filename)
+        else:
+            store = VocabStore(filename, persistence=PERSISTENCE)
+        _stores[filename] = store
+    store.refresh()
+    return store
+
+class VocabStore():
+    """
+    In-memory copy of a <to>_<from>_vocab.json file. The file is parsed once and all reads are
+    served from memory. Mutations mark the store dirty, and the file is only rewritten by save().
+
+    A reverse index maps each translation (raw and normalized) to the keys that list it, in
+    insertion order, so has_translation() is a set lookup. A second index maps each whole
+    translation list to its keys, for keys_with_translations(). Every mutation must go through
+    put/put_many/delete/mark_correct/replace to keep them current.
+
+    A due index buckets keys by part of speech and by the day they were last answered correctly,
+    with each part's bucket days kept sorted, so select_due() only visits due entries.
+
+    Entries are held as compact, immutable Entry records (see vocab_entry.py), converted from and
+    to the file's dicts as they are loaded and saved. put(), put_many() and replace() accept either.
+
+    Writers are serialized by an RLock: every mutating method takes it, and writing() holds it
+    across a group of mutations. On the gevent server, which isn't monkey-patched, every greenlet
+    runs on one thread, so the RLock is reentrant across greenlets and excludes nothing between
+    them. Writes are still exclusive there only because nothing yields inside writing(): the
+    server's only explicit yields, between import chunks and in translator backoff, happen outside
+    it. Code that could yield inside writing() needs a lock matching the server's concurrency
+    model, such as gevent.lock.RLock. Entries are copy-on-write: a mutation stores a new entry rather
+    than changing the stored one, so use get_mutable() to obtain a dict to modify.
+    snapshot() returns a point-in-time copy of the vocabulary that later writes never touch. The
+    vocab file is replaced atomically, through a temporary file and a rename.
+
+    In journal mode save() appends the entries changed since the last save to the journal, which is
+    replayed on load and compacted into the vocab file when it passes JOURNAL_MAX_BYTES.
+
+    When SHARED, several processes keep their own copy of the same file. The outermost writing()
+    block also holds a file lock on <vocab file>.lock, reloads if another process has written since,
+    and saves before letting go, so no process sits on unsaved changes. Every write replaces
+    <vocab file>.version, which refresh() checks to pick up other processes' writes.
+    """
+
+    def __init__(self, filename, persistence="snapshot"):
+        self.filename = filename
+        self.journal_filename = f"{filename}.journal"
+        self.journaled = persistence == "journal"
+        self.journal = None
+        self.journal_size = 0
+        self.last_fsync = 0
+        # Keys changed since the last save, mapped to "put" or "del"
+        self.pending = {}
+        self.needs_snapshot = False
+        self.bytes_written = 0
+        # Set whenever the vocab file is rewritten, cleared once VocabBuilder has backed it up. A
+        # save can happen in any writing() block, so set_vocab() can't go by save()'s result alone.
+        self.needs_backup = False
+        self.entries = {}
+        self.meta = None
+        self.dirty = False
+        self.loaded = False
+        # Bumped on every change. With epoch, which differs per process, it identifies the
+        # vocabulary's contents, e.g. for ETags.
+        self.version = 0
+        self.epoch = uuid.uuid4().hex[:8]
+        # Export file path -> "<epoch>-<version>" of the contents written to it
+        self.exports = {}
+        self.mtime = None
+        self.by_translation = {}
+        self.by_normalized = {}
+        self.by_list = {}
+        self.indexed = {}
+        # part -> day ordinal -> keys, part -> sorted day ordinals, key -> (part, day ordinal)
+        self.due = {}
+        self.due_days = {}
+        self.due_of = {}
+        self.lock = threading.RLock()
+        # Nesting depth of writing() blocks
+        self.depth = 0
+        self.process_lock = ProcessLock(f"{filename}.lock")
+        self.stamp_filename = f"{filename}.version"
+        # Identity of the version stamp as of our last load or write
+        self.stamp = None
+        # (version, entries) of the latest snapshot handed to readers
+        self.published = (None, {})
+
+    # Hold the writer lock across several mutations, so they are published together. When SHARED,
+    # the outermost block first reloads any newer data from disk, unless sync is False. Nothing
+    # inside may yield to another greenlet; see the class docstring.
+    @contextmanager
+    def writing(self, sync=True):
+        with self.lock:
+            outermost = self.depth == 0
+            self.depth += 1
+            try:
+                if outermost and SHARED:
+                    self.process_lock.acquire()
+                    if sync and self.loaded and not self.dirty and self.stale(): self.load()
+                yield
+                if outermost and SHARED and self.dirty:
+                    self.save()
+            finally:
+                self.depth -= 1
+                if outermost and SHARED:
+                    self.process_lock.release()
+
+    # The vocabulary as of the latest completed write, as a dict in the vocab file schema. It is
+    # copied once per version and shared by readers, so treat it as read-only. Apart from the first
+    # call, never waits on a writer: while a write is in progress the previous snapshot is returned.
+    def snapshot(self):
+        published = self.published
+        if published[0] == self.version: return published[1]
+        # Only the very first snapshot has to wait for a writer
+        if not self.lock.acquire(blocking=published[0] is None): return published[1]
+        try:
+            published = (self.version, dict(self.entries))
+            self.published = published
+        finally:
+            self.lock.release()
+        return published[1]
+
+    @timed("vocab_load")
+    def load(self):
+        with self.writing(sync=False), gc_paused():
+            # Read the stamp first, so a write that lands while loading triggers another reload
+            stamp = self.read_stamp()
+            entries = {}
+            meta = None
+            # Shares translations that repeat across entries, for the duration of the load
+            strings = {}
+            if exists(self.filename):
+                with open(self.filename, 'r') as f:
+                    metrics.add("vb_bytes_read_total", os.fstat(f.fileno()).st_size, kind="vocab")
+                    try:
+                        contents = json.loads(f.read())
+                        meta = contents.pop("meta", None)
+                        entries = {k: Entry.from_dict(v, strings) for k, v in contents.items()}
+                    except Exception as e:
+                        logging.error(f"Unable to parse vocab file {self.filename}: {e}")
+            self.entries = entries
+            self.meta = meta
+            self.close_journal()
+            self.pending = {}
+            self.needs_snapshot = False
+            replayed = self.replay_journal(strings) if self.journaled else 0
+            self.journal_size = self.file_size(self.journal_filename)
+            if replayed: metrics.add("vb_bytes_read_total", self.journal_size, kind="journal")
+            self.reindex()
+            self.dirty = False
+            self.loaded = True
+            self.version += 1
+            self.mtime = self.file_mtime()
+            self.stamp = stamp
+            logging.info(f"Loaded {len(self.entries)} entries from {self.filename}, replayed {replayed} journal records")
+            # Other processes may still be appending to the journal, so leave compaction to save()
+            if replayed and not SHARED:
+                self.compact()
+
+    # Reload only if the file was never read or was changed behind our back
+    def refresh(self):
+        if not self.loaded or (not self.dirty and self.stale()):
+            self.load()
+
+    # Whether the data on disk changed since we last loaded or wrote it
+    def stale(self):
+        if self.file_mtime() != self.mtime: return True
+        return SHARED and self.read_stamp() != self.stamp
+
+    # Identity of the current version stamp file. It is replaced on every write, so its inode changes.
+    def read_stamp(self):
+        try:
+            st = os.stat(self.stamp_filename)
+            return (st.st_ino, st.st_mtime_ns)
+        except OSError:
+            return None
+
+    # Tell other processes the data on disk changed
+    def write_stamp(self):
+        if not SHARED: return
+        with atomic_write(self.stamp_filename) as f:
+            f.write(f"{self.epoch}-{self.version}")
+        self.stamp = self.read_stamp()
+
+    def changed(self):
+        self.dirty = True
+        self.version += 1
+
+    def file_size(self, filename):
+        try:
+            return os.stat(filename).st_size
+        except OSError:
+            return 0
+
+    def file_mtime(self):
+        try:
+            return os.stat(self.filename).st_mtime_ns
+        except OSError:
+            return None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    # The stored entry. Treat it as read-only; see get_mutable().
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    # A copy of the entry, as a dict, that can be modified and handed to put()
+    def get_mutable(self, key, default=None):
+        entry = self.entries.get(key, None)
+        if entry is None: return default
+        return entry.to_dict()
+
+    def items(self):
+        return self.entries.items()
+
+    def keys(self):
+        return self.entries.keys()
+
+    # The whole vocabulary as a dict in the vocab file schema. Treat it as read-only.
+    def as_dict(self):
+        return self.snapshot()
+
+    # (key, translations) of every entry not answered correctly in the last min_age days,
+    # optionally restricted to one part of speech
+    def select_due(self, min_age, part_of_speech='Any'):
+        cutoff = date.today().toordinal() - int(min_age)
+        parts = self.due.keys() if part_of_speech == 'Any' else [part_of_speech]
+        selected = []
+        with self.lock:
+            for part in parts:
+                buckets = self.due.get(part, {})
+                days = self.due_days.get(part, [])
+                for day in days[:bisect_right(days, cutoff)]:
+                    selected.extend((k, self.entries[k].translations) for k in buckets[day])
+        return selected
+
+    @locked
+    def mark_correct(self, key, day):
+        entry = self.entries.get(key, None)
+        if entry is None: return False
+        entry = entry.marked_correct(day)
+        self.entries[key] = entry
+        self._index_due(key, entry)
+        self.pending[key] = "put"
+        self.changed()
+        return True
+
+    # Keys whose translations include text, in insertion order
+    def keys_for(self, text, normalized=False):
+        if normalized:
+            return list(self.by_normalized.get(normalize(text), ()))
+        return list(self.by_translation.get(text, ()))
+
+    # Whether the entry at key lists text among its translations
+    def has_translation(self, key, text, normalized=False):
+        if normalized:
+            return key in self.by_normalized.get(normalize(text), ())
+        return key in self.by_translation.get(text, ())
+
+    # Keys whose translation list is exactly translations, in insertion order
+    def keys_with_translations(self, translations):
+        return list(self.by_list.get(tuple(translations), ()))
+
+    @locked
+    def put(self, key, entry):
+        self._put(key, Entry.from_dict(entry))
+        self.changed()
+
+    # put() for each key and entry of entries, as one change
+    @locked
+    def put_many(self, entries):
+        for key, entry in entries.items():
+            self._put(key, Entry.from_dict(entry))
+        self.changed()
+
+    def _put(self, key, entry):
+        if (entry.translations or ()) != self.indexed.get(key, None):
+            self._unindex(key)
+            self._index(key, entry)
+        self._index_due(key, entry)
+        self.entries[key] = entry
+        self.pending[key] = "put"
+
+    @locked
+    def delete(self, key):
+        if key in self.entries:
+            self._unindex(key)
+            self._unindex_due(key)
+            del self.entries[key]
+            self.pending[key] = "del"
+            self.changed()
+            return True
+        return False
+
+    @locked
+    def replace(self, entries):
+        strings = {}
+        self.entries = {k: Entry.from_dict(v, strings) for k, v in entries.items() if k != "meta"}
+        self.reindex()
+        self.needs_snapshot = True
+        self.changed()
+
+    def reindex(self):
+        self.by_translation = {}
+        self.by_normalized = {}
+        self.by_list = {}
+        self.indexed = {}
+        self.due = {}
+        self.due_days = {}
+        self.due_of = {}
+        for key, entry in self.entries.items():
+            self._index(key, entry)
+            self._index_due(key, entry)
+
+    def _index_due(self, key, entry):
+        if key.strip() == '': return
+        slot = (entry.part, entry.due_day())
+        if self.due_of.get(key, None) == slot: return
+        self._unindex_due(key)
+        part, day = slot
+        buckets = self.due.setdefault(part, {})
+        if day not in buckets:
+            buckets[day] = {}
+            insort(self.due_days.setdefault(part, []), day)
+        buckets[day][key] = None
+        self.due_of[key] = slot
+
+    def _unindex_due(self, key):
+        slot = self.due_of.pop(key, None)
+        if slot is None: return
+        part, day = slot
+        buckets = self.due[part]
+        del buckets[day][key]
+        if not buckets[day]:
+            del buckets[day]
+            days = self.due_days[part]
+            del days[bisect_right(days, day) - 1]
+
+    def _index(self, key, entry):
+        translations = entry.translations or ()
+        self.indexed[key] = translations
+        self.by_list.setdefault(translations, {})[key] = None
+        for t in translations:
+            self.by_translation.setdefault(t, {})[key] = None
+            self.by_normalized.setdefault(normalize(t), {})[key] = None
+
+    def _unindex(self, key):
+        translations = self.indexed.pop(key, None)
+        if translations is None: return
+        keys = self.by_list[translations]
+        del keys[key]
+        if not keys: del self.by_list[translations]
+        for t in translations:
+            for index, text in ((self.by_translation, t), (self.by_normalized, normalize(t))):
+                keys = index.get(text, None)
+                if keys is not None:
+                    keys.pop(key, None)
+                    if not keys: del index[text]
+
+    # Persist pending changes. Returns True if the vocab file itself was rewritten.
+    @locked
+    @timed("vocab_save")
+    def save(self):
+        if not self.dirty: return False
+        if not self.journaled:
+            self.write_snapshot()
+            return True
+        if self.needs_snapshot:
+            self.compact()
+            return True
+        self.append_journal()
+        if self.journal_size >= JOURNAL_MAX_BYTES:
+            self.compact()
+            return True
+        return False
+
+    # Make the vocab file on disk reflect everything in memory
+    @locked
+    def checkpoint(self):
+        if self.journaled and (self.dirty or self.journal_size):
+            self.compact()
+        else:
+            self.save()
+
+    def write_snapshot(self):
+        contents = {"meta": self.meta, **self.entries} if self.meta is not None else self.entries
+        with gc_paused():
+            data = json.dumps(contents, default=entry_json)
+        with atomic_write(self.filename) as f:
+            f.write(data)
+        self.bytes_written += len(data)
+        metrics.add("vb_bytes_written_total", len(data), kind="vocab")
+        self.needs_backup = True
+        self.pending = {}
+        self.needs_snapshot = False
+        self.dirty = False
+        self.mtime = self.file_mtime()
+        self.write_stamp()
+
+    # Fold the journal into the vocab file. Replaying a journal over a snapshot that already
+    # contains its records is harmless, so a crash between the two steps loses nothing.
+    def compact(self):
+        self.write_snapshot()
+        self.close_journal()
+        with open(self.journal_filename, 'w'):
+            pass
+        self.journal_size = 0
+        self.write_stamp()
+        logging.debug("Compacted journal into %s", self.filename)
+
+    def append_journal(self):
+        records = []
+        for key, op in self.pending.items():
+            if op == "put" and key in self.entries:
+                records.append(json.dumps({"op": "put", "key": key, "entry": self.entries[key].to_dict()}))
+            else:
+                records.append(json.dumps({"op": "del", "key": key}))
+        data = "".join(r + "\n" for r in records)
+        if self.journal is None:
+            self.journal = open(self.journal_filename, 'a')
+        self.journal.write(data)
+        self.journal.flush()
+        if JOURNAL_FSYNC == "always" or \
+          (JOURNAL_FSYNC == "interval" and time.monotonic() - self.last_fsync >= JOURNAL_FSYNC_INTERVAL):
+            os.fsync(self.journal.fileno())
+            self.last_fsync = time.monotonic()
+        self.journal_size += len(data)
+        self.bytes_written += len(data)
+        metrics.add("vb_bytes_written_total", len(data), kind="journal")
+        self.pending = {}
+        self.dirty = False
+        self.write_stamp()
+
+    def replay_journal(self, strings=None):
+        count = 0
+        if not exists(self.journal_filename): return count
+        with open(self.journal_filename, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final record from an interrupted write
+                    logging.warning(f"Ignoring unreadable journal record in {self.journal_filename}")
+                    break
+                if record["op"] == "put":
+                    self.entries[record["key"]] = Entry.from_dict(record["entry"], strings)
+                else:
+                    self.entries.pop(record["key"], None)
+                count += 1
+        return count
+
+    # The vocab file was replaced wholesale: drop its stale journal and load the new contents
+    @locked
+    def reload_from_file(self):
+        self.close_journal()
+        if exists(self.journal_filename):
+            os.remove(self.journal_filename)
+        self.journal_size = 0
+        self.load()
+
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None